@@ -5,6 +5,7 @@ import os
 from notifier import send_email_notification, send_sms_notification, notify_user
 import json
 import plotly.express as px
+from storage import format_timestamp
 
 
 def render_system_settings_page(db, anpr_integration=None):
@@ -216,7 +217,7 @@ def render_system_settings_page(db, anpr_integration=None):
     # ──────── RESET TOOLS ──────── #
     st.subheader("🧼 System Cleanup Tools")
 
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns(3)
 
     with col1:
         if st.button("🔄 Reset Parking Spots"):
@@ -226,13 +227,16 @@ def render_system_settings_page(db, anpr_integration=None):
 
     with col2:
         if st.button("🧹 Clear Reservation History"):
-            empty_df = pd.DataFrame(
-                columns=['id', 'spot_id', 'plate_number', 'customer_name', 'customer_email', 'customer_phone',
-                         'start_time', 'end_time', 'duration_minutes', 'status', 'created_at'])
-            empty_df.to_csv(db.reservations_file, index=False)
+            db.clear_reservation_history()
             st.success("🧼 Reservation history cleared.")
             st.rerun()
 
+    with col3:
+        if st.button("🗄️ Archive Old History"):
+            moved = db.archive_history()
+            st.success(f"🗄️ Archived {moved['reservations']} reservations and "
+                       f"{moved['anpr_detections']} detections older than 7 days.")
+
     st.subheader("💣 Factory Reset (Danger Zone)")
 
     if st.button("🔥 FULL SYSTEM RESET"):
@@ -393,6 +397,21 @@ def render_analytics_page(spots_df, reservations_df):
 def render_admin_spot_map(spots_df, db):
     st.header("🗺️ Live Spot Map – Admin Control")
 
+    # ──────── BULK ACTIONS ──────── #
+    with st.expander("📦 Bulk Update Spots"):
+        bulk_spots = st.multiselect("Spots", spots_df['spot_id'].tolist(), key="bulk_spots")
+        bulk_status = st.selectbox("New Status", ["available", "reserved", "occupied", "maintenance"],
+                                   key="bulk_status")
+        if st.button("✅ Apply to Selected Spots", key="bulk_apply"):
+            if bulk_spots:
+                updated = db.update_spots_bulk([
+                    {"spot_id": spot_id, "status": bulk_status} for spot_id in bulk_spots
+                ])
+                st.success(f"🔄 {updated} spots updated to '{bulk_status}'")
+                st.rerun()
+            else:
+                st.warning("⚠️ Select at least one spot.")
+
     zones = sorted(spots_df['zone'].unique())
     for zone in zones:
         st.subheader(f"Zone {zone}")
@@ -424,7 +443,7 @@ def render_admin_spot_map(spots_df, db):
                                                 value=spot['reserved_by'],
                                                 key=f"by_{spot['spot_id']}")
                     reserved_until = st.text_input("Reserved Until",
-                                                   value=spot['reserved_until'],
+                                                   value=format_timestamp(spot['reserved_until']),
                                                    key=f"until_{spot['spot_id']}")
                 else:
                     # When status is available, clear these fields
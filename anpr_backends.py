@@ -0,0 +1,340 @@
+import argparse
+import glob
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+
+MODEL_DIR = "models"
+
+# backend -> (detector file, recognizer file) inside MODEL_DIR; "torch" uses the .pt / EasyOCR models.
+# "openvino" compiles the recognizer's ONNX file with OpenVINO, so both models run there.
+BACKENDS = {
+    "torch": (None, None),
+    "onnx": ("detector.onnx", "recognizer.onnx"),
+    "onnx-int8": ("detector.int8.onnx", "recognizer.int8.onnx"),
+    "openvino": ("detector_openvino_model", "recognizer.onnx"),
+}
+
+
+def backend_model_path(backend, model, model_dir=MODEL_DIR):
+    """Path of the exported ``model`` ("detector" or "recognizer") for ``backend``"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown ANPR backend: {backend} (choose from {', '.join(BACKENDS)})")
+    name = BACKENDS[backend][0 if model == "detector" else 1]
+    path = os.path.join(model_dir, name)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found; run: python anpr_backends.py export --model-dir {model_dir}")
+    return path
+
+
+# ==== Runtime ====
+class OnnxRecognizer:
+    """Drop-in for EasyOCR's torch recognizer that runs an exported ONNX model
+
+    EasyOCR only calls ``eval()`` and ``model(image, text)`` on its
+    recognizer, so assigning one of these to ``Reader.recognizer`` moves
+    recognition to ONNX Runtime while the batched ``get_text`` calls of
+    ANPRSystem and the CTC decoding stay as they are.
+    """
+
+    def __init__(self, path, threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def eval(self):
+        return self
+
+    def __call__(self, image, text=None):
+        import torch
+
+        output = self.session.run(None, {self.input_name: image.cpu().numpy()})[0]
+        return torch.from_numpy(output)
+
+
+class OpenVinoRecognizer:
+    """OnnxRecognizer counterpart that runs the exported recognizer with OpenVINO
+
+    OpenVINO reads the ONNX file directly, so the "openvino" backend needs
+    no separate recognizer export.
+    """
+
+    def __init__(self, path, threads=None):
+        import openvino as ov
+
+        config = {"INFERENCE_NUM_THREADS": threads} if threads else {}
+        self.model = ov.Core().compile_model(path, "CPU", config)
+        self.input_name = self.model.input(0).any_name
+
+    def eval(self):
+        return self
+
+    def __call__(self, image, text=None):
+        import torch
+
+        output = self.model({self.input_name: image.cpu().numpy()})[self.model.output(0)]
+        return torch.from_numpy(output)
+
+
+def load_recognizer(backend, model_dir=MODEL_DIR):
+    """The EasyOCR recognizer replacement for a non-torch ``backend``"""
+    path = backend_model_path(backend, "recognizer", model_dir)
+    if backend == "openvino":
+        return OpenVinoRecognizer(path)
+    return OnnxRecognizer(path)
+
+
+# ==== Export ====
+def _letterbox(image, size):
+    import cv2
+
+    height, width = image.shape[:2]
+    scale = size / float(max(height, width))
+    resized = cv2.resize(image, (int(width * scale), int(height * scale)))
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    canvas[:resized.shape[0], :resized.shape[1]] = resized
+    return canvas
+
+
+class _CalibrationImages:
+    """ONNX Runtime CalibrationDataReader over a folder of images, preprocessed like YOLO input"""
+
+    def __init__(self, paths, input_name, imgsz):
+        import cv2
+
+        self._batches = []
+        for path in paths:
+            image = cv2.imread(path)
+            if image is None:
+                continue
+            tensor = _letterbox(image, imgsz)[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+            self._batches.append({input_name: np.ascontiguousarray(tensor)})
+        self._iter = iter(self._batches)
+
+    def get_next(self):
+        return next(self._iter, None)
+
+
+def export_detector(yolo_model_path="yolov8n.pt", model_dir=MODEL_DIR, imgsz=640, int8=False,
+                    calibration_dir=None, openvino=False):
+    """Export the YOLO detector to ONNX (and optionally int8 / OpenVINO) in ``model_dir``
+
+    int8 uses static quantization calibrated on ``calibration_dir`` images
+    (dynamic quantization of convolutions is usually slower on CPU), so it
+    is skipped without them.
+    """
+    from ultralytics import YOLO
+
+    os.makedirs(model_dir, exist_ok=True)
+    model = YOLO(yolo_model_path)
+    # Dynamic axes: batches from BatchingDetector and ROI sizes from the detection ladder
+    exported = model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+    onnx_path = os.path.join(model_dir, BACKENDS["onnx"][0])
+    shutil.move(exported, onnx_path)
+    written = [onnx_path]
+
+    if int8:
+        paths = sorted(glob.glob(os.path.join(calibration_dir, "*"))) if calibration_dir else []
+        if not paths:
+            print("Skipping int8 detector: pass --calibration-dir with a few dozen gate images")
+        else:
+            import onnxruntime as ort
+            from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+            input_name = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+            int8_path = os.path.join(model_dir, BACKENDS["onnx-int8"][0])
+            quantize_static(onnx_path, int8_path, _CalibrationImages(paths, input_name, imgsz),
+                            quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8,
+                            weight_type=QuantType.QInt8)
+            written.append(int8_path)
+
+    if openvino:
+        exported = model.export(format="openvino", imgsz=imgsz)
+        openvino_path = os.path.join(model_dir, BACKENDS["openvino"][0])
+        shutil.rmtree(openvino_path, ignore_errors=True)
+        shutil.move(exported, openvino_path)
+        written.append(openvino_path)
+
+    return written
+
+
+def export_recognizer(model_dir=MODEL_DIR, int8=False, languages=("en",)):
+    """Export EasyOCR's recognizer to ONNX (and a dynamically quantized int8 copy)
+
+    Input is a batch of 64px-high grayscale crops of any width, which is
+    what EasyOCR feeds its recognizer.
+    """
+    import easyocr
+    import torch
+
+    os.makedirs(model_dir, exist_ok=True)
+    # EasyOCR quantizes its CPU recognizer by default, and torch.onnx can't export dynamically
+    # quantized modules; int8 comes from quantize_dynamic on the ONNX model below instead
+    reader = easyocr.Reader(list(languages), gpu=False, quantize=False)
+    recognizer = getattr(reader.recognizer, "module", reader.recognizer).cpu().eval()
+    dummy_image = torch.rand(1, 1, 64, 256)
+    dummy_text = torch.zeros(1, 1, dtype=torch.long)
+
+    onnx_path = os.path.join(model_dir, BACKENDS["onnx"][1])
+    torch.onnx.export(recognizer, (dummy_image, dummy_text), onnx_path, input_names=["image", "text"],
+                      output_names=["preds"], opset_version=13,
+                      dynamic_axes={"image": {0: "batch", 3: "width"}, "preds": {0: "batch", 1: "steps"}})
+    written = [onnx_path]
+
+    if int8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        # The recognizer is mostly LSTM and linear layers, where dynamic quantization pays off
+        int8_path = os.path.join(model_dir, BACKENDS["onnx-int8"][1])
+        quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+        written.append(int8_path)
+
+    return written
+
+
+# ==== Benchmark ====
+def load_image_set(image_dir):
+    """Images of a fixed benchmark set with their expected plates
+
+    Expected plates come from ``labels.json`` ({"file.jpg": "AB12CDE"}) if
+    present, otherwise from the file name up to the first underscore.
+    """
+    import cv2
+
+    labels = {}
+    labels_path = os.path.join(image_dir, "labels.json")
+    if os.path.exists(labels_path):
+        with open(labels_path, 'r') as f:
+            labels = json.load(f)
+
+    images = []
+    for path in sorted(glob.glob(os.path.join(image_dir, "*"))):
+        name = os.path.basename(path)
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        expected = labels.get(name, os.path.splitext(name)[0].split("_")[0])
+        images.append((name, image, str(expected).upper()))
+    return images
+
+
+def _percentile(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 2) if values else None
+
+
+def benchmark_backends(image_dir, backends=tuple(BACKENDS), model_dir=MODEL_DIR, warmup=2, repeat=1):
+    """Latency and read accuracy of each backend on the same images
+
+    ``agreement`` is the share of images where a backend read the same
+    plates as the torch path, which catches quantization damage even on
+    images without a usable label.
+    """
+    from integrated_anpr_parking import ANPRSystem
+
+    images = load_image_set(image_dir)
+    if not images:
+        raise ValueError(f"No images found in {image_dir}")
+
+    report = {"images": len(images), "backends": {}}
+    reference = None
+    for backend in backends:
+        try:
+            anpr_system = ANPRSystem(backend=backend, model_dir=model_dir)
+        except (FileNotFoundError, ImportError) as e:
+            report["backends"][backend] = {"error": str(e)}
+            continue
+
+        for _, image, _ in images[:warmup]:
+            anpr_system.process_frame(image)
+
+        detect_times, ocr_times, total_times = [], [], []
+        correct = 0
+        reads = []
+        for _ in range(repeat):
+            reads = []
+            for _, image, expected in images:
+                started = time.perf_counter()
+                plates = anpr_system.detect_plates(image)
+                detected = time.perf_counter()
+                detections = anpr_system.read_plates(image, plates)
+                finished = time.perf_counter()
+
+                detect_times.append(detected - started)
+                ocr_times.append(finished - detected)
+                total_times.append(finished - started)
+                plate_numbers = sorted(detection['plate_number'] for detection in detections)
+                reads.append(plate_numbers)
+                correct += expected in plate_numbers
+
+        result = {
+            "detect_ms_p50": _percentile(detect_times, 50),
+            "ocr_ms_p50": _percentile(ocr_times, 50),
+            "total_ms_p50": _percentile(total_times, 50),
+            "total_ms_p95": _percentile(total_times, 95),
+            "fps": round(len(total_times) / sum(total_times), 2),
+            "accuracy": round(correct / float(len(images) * repeat), 3),
+        }
+        if reference is None:
+            reference = reads
+        else:
+            same = sum(1 for ours, theirs in zip(reads, reference) if ours == theirs)
+            result["agreement"] = round(same / float(len(images)), 3)
+        report["backends"][backend] = result
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and benchmark CPU inference backends for ANPR")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="export the detector and OCR recognizer to ONNX")
+    export.add_argument("--yolo-model", default="yolov8n.pt")
+    export.add_argument("--model-dir", default=MODEL_DIR)
+    export.add_argument("--imgsz", type=int, default=640)
+    export.add_argument("--int8", action="store_true", help="also write int8-quantized models")
+    export.add_argument("--calibration-dir", help="images used to calibrate the int8 detector")
+    export.add_argument("--openvino", action="store_true",
+                        help="also export the detector for OpenVINO (the recognizer's ONNX file is compiled at load)")
+
+    bench = commands.add_parser("benchmark", help="compare backends on a fixed image set")
+    bench.add_argument("image_dir")
+    bench.add_argument("--model-dir", default=MODEL_DIR)
+    bench.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    bench.add_argument("--repeat", type=int, default=1)
+    bench.add_argument("--output", help="write the report as JSON")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        written = export_detector(args.yolo_model, args.model_dir, args.imgsz, args.int8,
+                                  args.calibration_dir, args.openvino)
+        written += export_recognizer(args.model_dir, args.int8)
+        for path in written:
+            print(f"Wrote {path}")
+        return
+
+    report = benchmark_backends(args.image_dir, args.backends, args.model_dir, repeat=args.repeat)
+    print(f"{'backend':<10} {'detect p50':>10} {'ocr p50':>8} {'total p50':>9} {'p95':>8} {'fps':>6} "
+          f"{'acc':>6} {'agree':>6}")
+    for backend, result in report["backends"].items():
+        if "error" in result:
+            print(f"{backend:<10} {result['error']}")
+            continue
+        print(f"{backend:<10} {result['detect_ms_p50']:>10} {result['ocr_ms_p50']:>8} "
+              f"{result['total_ms_p50']:>9} {result['total_ms_p95']:>8} {result['fps']:>6} "
+              f"{result['accuracy']:>6} {result.get('agreement', '-'):>6}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
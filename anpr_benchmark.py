@@ -0,0 +1,275 @@
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from integrated_anpr_parking import ANPRSystem
+from plate_tracker import iou
+
+
+# Real plates avoid letters that read as digits; keeps the ground truth unambiguous
+LETTERS = "ABCDEFGHJKLMNPRSTUVWXYZ"
+DIGITS = "0123456789"
+
+
+# ==== Synthetic Plates ====
+def random_plate(rng, patterns=ANPRSystem.PLATE_PATTERNS):
+    """A random plate matching one of the ``[A-Z]{n}`` / ``\\d{n}`` validation patterns"""
+    pattern = patterns[rng.integers(len(patterns))]
+    text = ""
+    for charset, count in re.findall(r'(\[A-Z\]|\\d)\{(\d+)\}', pattern):
+        alphabet = LETTERS if charset == "[A-Z]" else DIGITS
+        text += "".join(alphabet[i] for i in rng.integers(len(alphabet), size=int(count)))
+    return text
+
+
+def render_plate(text, height=60):
+    """A plain black-on-white plate image for ``text``"""
+    font, scale, thickness = cv2.FONT_HERSHEY_DUPLEX, height / 40.0, max(2, height // 20)
+    (text_width, text_height), _ = cv2.getTextSize(text, font, scale, thickness)
+    width = text_width + height // 2
+    plate = np.full((height, width, 3), 255, dtype=np.uint8)
+    cv2.rectangle(plate, (0, 0), (width - 1, height - 1), (0, 0, 0), max(2, height // 25))
+    cv2.putText(plate, text, ((width - text_width) // 2, (height + text_height) // 2), font, scale,
+                (0, 0, 0), thickness, cv2.LINE_AA)
+    return plate
+
+
+def synthetic_background(rng, size=(1280, 720)):
+    """Road-ish background: grey gradient, noise and a few car-coloured blocks"""
+    width, height = size
+    gradient = np.linspace(70, 150, height, dtype=np.float32)[:, None, None]
+    background = np.repeat(np.repeat(gradient, width, axis=1), 3, axis=2)
+    background += rng.normal(0, 8, background.shape)
+    for _ in range(rng.integers(1, 4)):
+        x, y = int(rng.integers(0, width - 200)), int(rng.integers(height // 3, height - 150))
+        color = [float(c) for c in rng.integers(20, 230, size=3)]
+        cv2.rectangle(background, (x, y), (x + int(rng.integers(200, 400)), y + int(rng.integers(100, 200))),
+                      color, -1)
+    return np.clip(background, 0, 255).astype(np.uint8)
+
+
+def make_scene(rng, background, text, plate_height=None):
+    """Paste a slightly warped, blurred plate into ``background``; returns (image, bbox)"""
+    image = background.copy()
+    frame_height, frame_width = image.shape[:2]
+    plate = render_plate(text, plate_height or int(rng.integers(30, 70)))
+    height, width = plate.shape[:2]
+
+    # Small perspective tilt, like a camera looking down at the lane
+    jitter = 0.06 * width
+    corners = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    warped = corners + rng.uniform(-jitter, jitter, corners.shape).astype(np.float32)
+    warped -= warped.min(axis=0)
+    out_width, out_height = (int(v) + 1 for v in warped.max(axis=0))
+    matrix = cv2.getPerspectiveTransform(corners, warped)
+    plate = cv2.warpPerspective(plate, matrix, (out_width, out_height), borderValue=(0, 0, 0))
+    mask = cv2.warpPerspective(np.full((height, width), 255, np.uint8), matrix, (out_width, out_height))
+
+    x = int(rng.integers(0, max(1, frame_width - out_width)))
+    y = int(rng.integers(frame_height // 3, max(frame_height // 3 + 1, frame_height - out_height)))
+    region = image[y:y + out_height, x:x + out_width]
+    mask = mask[:region.shape[0], :region.shape[1]] > 0
+    region[mask] = plate[:region.shape[0], :region.shape[1]][mask]
+
+    image = cv2.GaussianBlur(image, (3, 3), rng.uniform(0.3, 1.2))
+    noise = rng.normal(0, rng.uniform(2, 8), image.shape)
+    image = np.clip(image.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+    return image, (x, y, x + region.shape[1], y + region.shape[0])
+
+
+def load_backgrounds(background_dir, size=(1280, 720)):
+    backgrounds = []
+    for path in sorted(glob.glob(os.path.join(background_dir, "*"))):
+        image = cv2.imread(path)
+        if image is not None:
+            backgrounds.append(cv2.resize(image, size))
+    return backgrounds
+
+
+def make_video(path, rng, background, plates, frames_per_plate=30, fps=15):
+    """Short clip of each plate driving across ``background``; returns the plates in order"""
+    height, width = background.shape[:2]
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    for text in plates:
+        plate = render_plate(text, int(rng.integers(40, 70)))
+        plate_height, plate_width = plate.shape[:2]
+        y = int(rng.integers(height // 2, height - plate_height))
+        for step in range(frames_per_plate):
+            frame = background.copy()
+            x = int((width - plate_width) * step / max(1, frames_per_plate - 1))
+            frame[y:y + plate_height, x:x + plate_width] = plate
+            writer.write(frame)
+    writer.release()
+    return plates
+
+
+# ==== Benchmark ====
+def summarize(seconds):
+    """Latency percentiles in milliseconds"""
+    if not seconds:
+        return {}
+    ms = np.asarray(seconds) * 1000
+    return {"count": len(ms), "mean": round(float(ms.mean()), 2), "p50": round(float(np.percentile(ms, 50)), 2),
+            "p95": round(float(np.percentile(ms, 95)), 2), "p99": round(float(np.percentile(ms, 99)), 2)}
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def _overlaps(bbox, truth, threshold=0.3):
+    return iou(bbox, truth) >= threshold
+
+
+def run_benchmark(anpr_system, scenes=50, seed=0, backgrounds=None, video_plates=0, warmup=2):
+    """Time every ANPR stage on synthetic scenes and score the reads against the rendered plates
+
+    Stages: detect_plates (recall = a box overlapping the plate),
+    extract_text and _enhance_plate_image on the ground-truth crop (so
+    OCR is judged apart from detection), and process_image end to end
+    from a JPEG on disk. With ``video_plates``, a clip is rendered and
+    every frame goes through process_frame for throughput.
+    """
+    rng = np.random.default_rng(seed)
+    work_dir = tempfile.mkdtemp(prefix="anpr_bench_")
+    timings = {"detect_plates": [], "extract_text": [], "_enhance_plate_image": [], "process_image": []}
+    found = read = end_to_end = 0
+
+    try:
+        samples = []
+        for index in range(scenes):
+            background = backgrounds[index % len(backgrounds)] if backgrounds else synthetic_background(rng)
+            text = random_plate(rng)
+            image, bbox = make_scene(rng, background, text)
+            path = os.path.join(work_dir, f"scene_{index:04d}.jpg")
+            cv2.imwrite(path, image)
+            samples.append((text, image, bbox, path))
+
+        for _, image, _, path in samples[:warmup]:
+            anpr_system.process_image(path)
+        anpr_system.reset_ocr_stats()
+
+        for text, image, bbox, path in samples:
+            plates, elapsed = _timed(anpr_system.detect_plates, image)
+            timings["detect_plates"].append(elapsed)
+            found += any(_overlaps(plate['bbox'], bbox) for plate in plates)
+
+            x1, y1, x2, y2 = bbox
+            crop = image[y1:y2, x1:x2]
+            (raw_text, _), elapsed = _timed(anpr_system.extract_text, crop)
+            timings["extract_text"].append(elapsed)
+            read += anpr_system._clean_plate_text(raw_text) == text
+
+            _, elapsed = _timed(anpr_system._enhance_plate_image, crop)
+            timings["_enhance_plate_image"].append(elapsed)
+
+            detections, elapsed = _timed(anpr_system.process_image, path)
+            timings["process_image"].append(elapsed)
+            end_to_end += any(detection['plate_number'] == text for detection in detections)
+
+        report = {
+            "config": {"scenes": scenes, "seed": seed, "backgrounds": len(backgrounds or []),
+                       "backend": getattr(anpr_system, "backend", "torch")},
+            "stages": {stage: summarize(seconds) for stage, seconds in timings.items()},
+            "accuracy": {
+                "detection_recall": round(found / float(scenes), 3),
+                "ocr_on_true_crop": round(read / float(scenes), 3),
+                "end_to_end": round(end_to_end / float(scenes), 3),
+            },
+            "fps": round(scenes / sum(timings["process_image"]), 2),
+            "ocr_cascade": anpr_system.get_ocr_stats(),
+        }
+
+        if video_plates:
+            background = backgrounds[0] if backgrounds else synthetic_background(rng)
+            video_path = os.path.join(work_dir, "clip.mp4")
+            plates = make_video(video_path, rng, background, [random_plate(rng) for _ in range(video_plates)])
+            cap = cv2.VideoCapture(video_path)
+            frame_times, seen = [], set()
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                detections, elapsed = _timed(anpr_system.process_frame, frame)
+                frame_times.append(elapsed)
+                seen.update(detection['plate_number'] for detection in detections)
+            cap.release()
+            report["video"] = {
+                "frames": len(frame_times),
+                "process_frame": summarize(frame_times),
+                "fps": round(len(frame_times) / sum(frame_times), 2) if frame_times else 0.0,
+                "plates_read": round(len(seen & set(plates)) / float(len(plates)), 3),
+                "false_reads": len(seen - set(plates)),
+            }
+        return report
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def compare(report, baseline, tolerance=0.1):
+    """Lines describing latency regressions beyond ``tolerance`` and any accuracy change"""
+    lines = []
+    for stage, stats in report["stages"].items():
+        old = baseline.get("stages", {}).get(stage, {})
+        for key in ("p50", "p95"):
+            if old.get(key) and stats.get(key):
+                change = stats[key] / old[key] - 1
+                flag = "REGRESSION" if change > tolerance else ("faster" if change < -tolerance else "")
+                lines.append(f"{stage:<22} {key} {old[key]:>9.2f} -> {stats[key]:>9.2f} ms "
+                             f"({change:+.0%}) {flag}".rstrip())
+    for metric, value in report["accuracy"].items():
+        old = baseline.get("accuracy", {}).get(metric)
+        if old is not None:
+            flag = "REGRESSION" if value < old else ""
+            lines.append(f"{metric:<22}     {old:>9.3f} -> {value:>9.3f} {flag}".rstrip())
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ANPR pipeline on synthetic plate imagery")
+    parser.add_argument("--scenes", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backgrounds", help="folder of background images (default: synthetic)")
+    parser.add_argument("--video-plates", type=int, default=0, help="also render a clip with this many plates")
+    parser.add_argument("--backend", default=None, help="ANPRSystem backend (see anpr_backends.py)")
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    args = parser.parse_args()
+
+    anpr_system = ANPRSystem(confidence_threshold=0.6, ocr_confidence_threshold=0.5, backend=args.backend)
+    backgrounds = load_backgrounds(args.backgrounds) if args.backgrounds else None
+    report = run_benchmark(anpr_system, args.scenes, args.seed, backgrounds, args.video_plates)
+
+    print(f"{'stage':<22} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9}  (ms)")
+    for stage, stats in report["stages"].items():
+        print(f"{stage:<22} {stats['mean']:>9} {stats['p50']:>9} {stats['p95']:>9} {stats['p99']:>9}")
+    print(f"fps (process_image): {report['fps']}")
+    for metric, value in report["accuracy"].items():
+        print(f"{metric}: {value}")
+    if "video" in report:
+        print(f"video: {report['video']['fps']} fps, plates read {report['video']['plates_read']}, "
+              f"false reads {report['video']['false_reads']}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        print("\nAgainst baseline:")
+        for line in compare(report, baseline):
+            print(line)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class RollingHistogram:
+    """The last ``window`` observations of one timer, summarized as percentiles on demand"""
+
+    def __init__(self, window=1000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def snapshot(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {"count": self.count}
+
+        def percentile(q):
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+        return {
+            "count": self.count,
+            "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(ordered[-1] * 1000, 2),
+        }
+
+
+# ==== Metrics ====
+class Metrics:
+    """Thread-safe timers (rolling histograms), counters and gauges for the ANPR stages
+
+    ANPRParkingIntegration owns one and hands it to its ANPRSystem and
+    ANPRPipeline, so one ``snapshot()`` covers capture, YOLO, every OCR
+    variant, the denoiser, parking decisions and CSV persistence.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._timings = {}
+            self._counters = {}
+            self._gauges = {}
+            self._started = time.time()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self._timings.get(name)
+            if histogram is None:
+                histogram = self._timings[name] = RollingHistogram(self.window)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "since": self._started,
+                "timings": {name: histogram.snapshot() for name, histogram in sorted(self._timings.items())},
+                "counters": dict(sorted(self._counters.items())),
+                "gauges": dict(sorted(self._gauges.items())),
+            }
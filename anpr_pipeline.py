@@ -0,0 +1,435 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+from anpr_metrics import Metrics
+from camera_config import DetectionRegion, camera_gate
+from motion_gate import MotionGate
+from plate_tracker import PlateTracker
+
+
+class DropOldestQueue(queue.Queue):
+    """Bounded queue whose put() never blocks: when full, the oldest item is dropped
+
+    Used between capture and the vision stages, where a stale frame is worth
+    less than the one that just arrived.
+    """
+
+    def __init__(self, maxsize=2):
+        super().__init__(maxsize)
+        self.dropped = 0
+
+    def put(self, item, block=True, timeout=None):
+        with self.not_full:
+            if 0 < self.maxsize <= self._qsize():
+                self._get()
+                self.dropped += 1
+            else:
+                self.unfinished_tasks += 1
+            self._put(item)
+            self.not_empty.notify()
+
+
+class Stage:
+    """Worker thread(s) that take items from ``inbox``, run ``fn`` and forward the result
+
+    ``fn`` returning None forwards nothing. With ``max_batch`` > 1, ``fn``
+    gets a list of everything already waiting (up to ``max_batch``) instead
+    of a single item. Forwarding into a full regular queue blocks, so a slow
+    stage pushes back on the one before it until a DropOldestQueue absorbs it.
+    Each call of ``fn`` is timed into ``metrics`` as ``pipeline.<name>``.
+    """
+
+    POLL = 0.2
+
+    def __init__(self, name, fn, inbox, outbox=None, workers=1, max_batch=1, metrics=None):
+        self.name = name
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.workers = workers
+        self.max_batch = max_batch
+        self.metrics = metrics or Metrics()
+        self.stats = {"processed": 0, "errors": 0}
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._run, name=f"anpr-{self.name}-{i}", daemon=True)
+                         for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+
+    def _take(self):
+        item = self.inbox.get(timeout=self.POLL)
+        if self.max_batch <= 1:
+            return item, 1
+        batch = [item]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.inbox.get_nowait())
+            except queue.Empty:
+                break
+        return batch, len(batch)
+
+    def _forward(self, result):
+        while not self._stop.is_set():
+            try:
+                self.outbox.put(result, timeout=self.POLL)
+                return
+            except queue.Full:
+                continue
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                item, count = self._take()
+            except queue.Empty:
+                continue
+            try:
+                with self.metrics.timer(f"pipeline.{self.name}"):
+                    result = self.fn(item)
+            except Exception as e:
+                print(f"Error in ANPR {self.name} stage: {e}")
+                with self._lock:
+                    self.stats["errors"] += 1
+                self.metrics.incr(f"pipeline.{self.name}.errors")
+                continue
+            with self._lock:
+                self.stats["processed"] += count
+            if self.outbox is not None and result is not None:
+                self._forward(result)
+
+
+# ==== Batched Detection ====
+class BatchingDetector:
+    """Shared YOLO service that runs frames from many sources as one batched call
+
+    Callers submit a frame and get a Future back. The thread takes a batch
+    of frames (up to ``max_batch``, or whatever arrives within ``max_delay``
+    seconds of the first one), runs ``detect_plates_batch`` once and
+    resolves each Future with the plates of its own frame.
+    """
+
+    def __init__(self, anpr_system, max_batch=8, max_delay=0.02):
+        self.anpr_system = anpr_system
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.stats = {"frames": 0, "batches": 0, "failures": 0}
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="anpr-detector", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame, imgsz=None):
+        future = Future()
+        self._queue.put((frame, imgsz, future))
+        return future
+
+    def detect(self, frame, imgsz=None):
+        return self.submit(frame, imgsz).result()
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            batch = [request]
+            stopping = False
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+            self._detect(batch)
+            if stopping:
+                return
+
+    def _detect(self, batch):
+        # One YOLO call per input size; sources with different ROI ladders can share a batch window
+        groups = {}
+        for frame, imgsz, future in batch:
+            if future.set_running_or_notify_cancel():
+                groups.setdefault(imgsz, []).append((frame, future))
+        for imgsz, group in groups.items():
+            self.stats["frames"] += len(group)
+            self.stats["batches"] += 1
+            try:
+                results = self.anpr_system.detect_plates_batch([frame for frame, _ in group], imgsz=imgsz)
+            except Exception as e:
+                self.stats["failures"] += 1
+                for _, future in group:
+                    future.set_exception(e)
+                continue
+            for (_, future), plates in zip(group, results):
+                future.set_result(plates)
+
+
+# ==== ANPR Pipeline ====
+class ANPRPipeline:
+    """capture → detect → OCR → parking decision → persistence, one stage per worker
+
+    The capture side calls ``submit(frame)``, which never blocks: the frame
+    and detected-frame queues hold only the freshest couple of frames and
+    drop older ones under load. Detections after OCR are never dropped; the
+    persistence stage writes them in batches so slow CSV I/O only delays
+    the log, not capture or the parking decisions.
+
+    With a shared ``detector`` (BatchingDetector), several detect workers
+    keep frames in flight so they can be batched together with frames from
+    the other pipelines using the same detector. The OCR stage likewise
+    reads the plates of up to ``ocr_batch`` waiting frames in one batched
+    recognizer call.
+
+    With ``track_plates`` on, a PlateTracker per source sits between
+    detection and OCR: a car is read only until its plate text settles by
+    vote, and each track reports one detection. A tracker must see its
+    frames in capture order, so every source is pinned to one of the
+    ``ocr_workers`` (each with its own detected-frame queue), and a frame
+    that the parallel detect workers deliver after a newer one from the
+    same source is dropped instead of moving its tracks back in time.
+
+    ``offer(frame)`` is ``submit`` behind a per-source MotionGate: frames
+    from an idle scene never reach the detector, and the detector's results
+    tighten or relax that source's stride.
+
+    With ``vision=False`` only the decision and persistence stages run, fed
+    through ``submit_detections`` by detectors living elsewhere. Detections
+    are persisted with ``detection_log.save_detections``: the ParkingDatabase
+    in the web app, so the log goes through its storage, otherwise the
+    ANPRSystem's own CSV log.
+
+    Stage timings, the capture-to-decision latency (``pipeline.latency``)
+    and, on ``get_metrics()``, queue depths and dropped frames go to
+    ``metrics``; pass the ANPRSystem's Metrics to get one combined view.
+    """
+
+    def __init__(self, anpr_system, db, detection_cooldown=10, frame_queue_size=2, ocr_workers=1,
+                 detector=None, detect_workers=1, ocr_batch=4, track_plates=True, on_result=None,
+                 vision=True, detection_log=None, metrics=None):
+        self.anpr_system = anpr_system
+        self.metrics = metrics or Metrics()
+        self.db = db
+        self.detection_log = detection_log or anpr_system
+        self.detector = detector
+        self.detection_cooldown = detection_cooldown
+        self.on_result = on_result
+        self.last_detection_time = {}
+        self.track_plates = track_plates
+        self.trackers = {}  # source -> PlateTracker
+        self.gates = {}  # source -> MotionGate
+        self.regions = {}  # source -> DetectionRegion
+        self.locations = {}  # source -> camera location written with its detections
+
+        self.frames = DropOldestQueue(frame_queue_size)
+        self.detected = [DropOldestQueue(frame_queue_size) for _ in range(max(1, ocr_workers))]
+        self.ocr_routes = {}  # source -> index of the OCR worker (and queue) it is pinned to
+        self.last_tracked = {}  # source -> capture time of the newest frame its tracker has seen
+        self._routes_lock = threading.Lock()
+        self.detections = queue.Queue(maxsize=256)
+        self.decided = queue.Queue(maxsize=1024)
+
+        self.stages = [
+            Stage("decision", self._decide, self.detections, self.decided, metrics=self.metrics),
+            Stage("persistence", self._persist, self.decided, max_batch=64, metrics=self.metrics),
+        ]
+        if vision:
+            # The detect stage routes frames to the OCR queues itself
+            self.stages[:0] = [Stage("detect", self._detect, self.frames, workers=detect_workers,
+                                     metrics=self.metrics)] + [
+                Stage("ocr" if len(self.detected) == 1 else f"ocr-{index}", self._ocr, inbox, self.detections,
+                      max_batch=ocr_batch, metrics=self.metrics)
+                for index, inbox in enumerate(self.detected)
+            ]
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self):
+        for stage in self.stages:
+            stage.stop()
+
+    def submit(self, frame, source=None, moving=True):
+        """Hand a captured frame to the pipeline (drops the oldest waiting frame if busy)
+
+        ``moving`` False (a heartbeat frame of a still scene) keeps detection
+        on the first rung of the source's size ladder.
+        """
+        self.frames.put({"frame": frame, "captured_at": time.time(), "source": source, "moving": moving})
+
+    def submit_detections(self, detections):
+        """Hand already-read detections (e.g. from ANPR worker processes) to the decision stage"""
+        self.detections.put(detections)
+
+    def set_gate(self, source, gate):
+        """Use ``gate`` (e.g. a MotionGate with lane polygons) for frames offered from ``source``"""
+        self.gates[source] = gate
+
+    def add_camera(self, camera):
+        """Set up gate, region and location for a CameraRegistry entry (its id is the source)"""
+        source = camera["id"]
+        self.set_gate(source, camera_gate(camera))
+        self.set_region(source, DetectionRegion.from_config(camera))
+        self.locations[source] = camera["location"]
+
+    def set_region(self, source, region):
+        """Detect on ``region`` (a DetectionRegion) for frames from ``source``"""
+        self.regions[source] = region
+
+    def offer(self, frame, source=None):
+        """Submit ``frame`` only if the source's motion gate says it is worth detecting on"""
+        gate = self.gates.get(source)
+        if gate is None:
+            gate = self.gates[source] = MotionGate(min_stride=2, max_stride=10)
+        if gate.should_infer(frame):
+            self.submit(frame, source, moving=gate.moving)
+            return True
+        return False
+
+    def stats(self):
+        return {
+            "stages": {stage.name: dict(stage.stats) for stage in self.stages},
+            "queue_depths": {
+                "frames": self.frames.qsize(),
+                "detected": sum(inbox.qsize() for inbox in self.detected),
+                "detections": self.detections.qsize(),
+                "decided": self.decided.qsize(),
+            },
+            "dropped_frames": self.frames.dropped + sum(inbox.dropped for inbox in self.detected),
+            "gates": {source: dict(gate.stats, stride=gate.stride)
+                      for source, gate in list(self.gates.items())},
+            "trackers": {source: dict(tracker.stats, active=len(tracker.tracks))
+                         for source, tracker in list(self.trackers.items())},
+        }
+
+    def get_metrics(self):
+        """``metrics`` snapshot with the current queue depths and dropped frames as gauges"""
+        stats = self.stats()
+        for name, depth in stats["queue_depths"].items():
+            self.metrics.gauge(f"queue.{name}", depth)
+        self.metrics.gauge("pipeline.dropped_frames", stats["dropped_frames"])
+        return self.metrics.snapshot()
+
+    # ---- Stages ----
+    def _detect(self, item):
+        detect_fn = self.detector.detect if self.detector is not None else self.anpr_system.detect_plates
+        region = self.regions.get(item["source"])
+        if region is not None:
+            # Climb the size ladder only for motion in the region or a car already being tracked
+            tracker = self.trackers.get(item["source"])
+            escalate = item.get("moving", True) or bool(tracker is not None and tracker.tracks)
+            plates = region.detect(item["frame"], detect_fn, escalate=escalate)
+        else:
+            plates = detect_fn(item["frame"])
+        gate = self.gates.get(item["source"])
+        if gate is not None:
+            gate.report(bool(plates))
+        # Empty frames still go to the tracker so it can tell when a car has left
+        if not plates and not self.track_plates:
+            return None
+        item["plates"] = plates
+        self._ocr_inbox(item["source"]).put(item)
+        return None
+
+    def _ocr_inbox(self, source):
+        """The detected-frame queue of the OCR worker ``source`` is pinned to (assigned round robin)"""
+        with self._routes_lock:
+            index = self.ocr_routes.get(source)
+            if index is None:
+                index = self.ocr_routes[source] = len(self.ocr_routes) % len(self.detected)
+        return self.detected[index]
+
+    def _tracker(self, source):
+        tracker = self.trackers.get(source)
+        if tracker is None:
+            tracker = self.trackers[source] = PlateTracker()
+        return tracker
+
+    def _ocr(self, items):
+        if isinstance(items, dict):
+            items = [items]
+        items = sorted(items, key=lambda item: item["captured_at"])
+        if self.track_plates:
+            # Only this worker handles these sources, so last_tracked can't change under us
+            fresh = []
+            for item in items:
+                if item["captured_at"] < self.last_tracked.get(item["source"], 0):
+                    self.metrics.incr("pipeline.stale_frames")
+                    continue
+                self.last_tracked[item["source"]] = item["captured_at"]
+                fresh.append(item)
+            items = fresh
+            if not items:
+                return None
+
+        finished = []
+        to_read = []
+        for item in items:
+            if self.track_plates:
+                plates, ended = self._tracker(item["source"]).update(item["plates"], item["captured_at"])
+                finished.extend(ended)
+            else:
+                plates = item["plates"]
+            to_read.append(plates)
+
+        per_frame = self.anpr_system.read_plates_batch([item["frame"] for item in items], to_read)
+        detections = []
+        for item, frame_detections in zip(items, per_frame):
+            captured_at = datetime.fromtimestamp(item["captured_at"]).strftime('%Y-%m-%d %H:%M:%S')
+            for detection in frame_detections:
+                detection["detection_time"] = captured_at
+                detection["captured_at"] = item["captured_at"]
+                detection["source"] = item["source"]
+                detection["camera_location"] = self.locations.get(item["source"], "")
+            if self.track_plates:
+                detections.extend(self._tracker(item["source"]).record(frame_detections))
+            else:
+                detections.extend(frame_detections)
+        return finished + detections or None
+
+    def _decide(self, detections):
+        accepted = []
+        for detection in detections:
+            plate_number = detection['plate_number']
+            # Cooldown is measured in capture time, so queueing delay doesn't shorten it
+            last_seen = self.last_detection_time.get(plate_number)
+            if last_seen is not None and detection["captured_at"] - last_seen <= self.detection_cooldown:
+                continue
+            self.last_detection_time[plate_number] = detection["captured_at"]
+
+            with self.metrics.timer("decision.process_anpr_detection"):
+                result = self.db.process_anpr_detection(
+                    plate_number=plate_number,
+                    confidence=detection['confidence'],
+                    is_emergency=detection['is_emergency']
+                )
+            self.metrics.observe("pipeline.latency", time.time() - detection["captured_at"])
+            if result:
+                print(f"ANPR Detection: {result['message']}")
+            if self.on_result:
+                self.on_result(detection, result)
+            accepted.append(detection)
+        return accepted or None
+
+    def _persist(self, batches):
+        detections = [detection for batch in batches for detection in batch]
+        self.detection_log.save_detections(detections)
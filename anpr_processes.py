@@ -0,0 +1,421 @@
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from anpr_pipeline import ANPRPipeline
+from camera_config import DetectionRegion, camera_gate, is_file_source
+
+
+# Per-camera counters shared between the capture process, the workers and this process
+STATUS, FRAMES, SUBMITTED, DROPPED, FPS, LAST_FRAME_AT, RECONNECTS, STRIDE, RESULTS, FOUND = range(10)
+CAMERA_FIELDS = 10
+STATUSES = ["starting", "running", "reconnecting", "finished", "failed", "stopped"]
+
+
+# ==== Frame Ring ====
+class FrameRing:
+    """Fixed number of frame slots in one shared memory block
+
+    Every slot holds up to ``slot_shape`` bytes of a decoded uint8 frame.
+    ``view(slot, shape)`` is an ndarray over the shared block itself, so a
+    capture process can decode straight into a slot and a worker process
+    can run YOLO and OCR on it without either side copying or pickling
+    the frame; only the slot index and shape travel over a queue.
+    """
+
+    def __init__(self, slots, slot_shape, name=None):
+        self.slots = slots
+        self.slot_shape = tuple(slot_shape)
+        self.slot_bytes = int(np.prod(self.slot_shape))
+        self._owner = name is None
+        # Spawned children share the parent's resource tracker, so attaching
+        # here does not get the block unlinked when a child exits
+        self._shm = shared_memory.SharedMemory(name=name, create=self._owner, size=slots * self.slot_bytes)
+        self._buffer = np.ndarray((slots, self.slot_bytes), dtype=np.uint8, buffer=self._shm.buf)
+
+    @property
+    def spec(self):
+        """Picklable description for ``attach`` in another process"""
+        return {"name": self._shm.name, "slots": self.slots, "slot_shape": self.slot_shape}
+
+    @classmethod
+    def attach(cls, spec):
+        return cls(spec["slots"], spec["slot_shape"], name=spec["name"])
+
+    def fits(self, shape):
+        return int(np.prod(shape)) <= self.slot_bytes
+
+    def view(self, slot, shape):
+        """The frame of ``shape`` stored in ``slot``, backed by shared memory"""
+        return self._buffer[slot, :int(np.prod(shape))].reshape(shape)
+
+    def close(self):
+        self._buffer = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # A view is still alive somewhere in this process; the OS frees the block on exit
+            pass
+        if self._owner:
+            self._shm.unlink()
+
+
+# ==== Capture Process ====
+def capture_process(camera, ring_spec, free_slots, ready, counters, stop):
+    """Decode one camera into free ring slots and queue the slots the motion gate lets through
+
+    When the workers fall behind and no slot is free, frames keep being
+    read (so live streams don't back up) but are dropped and counted.
+    """
+    import cv2
+
+    ring = FrameRing.attach(ring_spec)
+    gate = camera_gate(camera)
+    is_file = is_file_source(camera["source"])
+    slot, shape = None, None
+    results_seen = 0
+    backoff = 1
+    window_start, window_frames = time.monotonic(), 0
+
+    try:
+        while not stop.is_set():
+            cap = cv2.VideoCapture(camera["source"])
+            if not cap.isOpened():
+                if is_file:
+                    counters[STATUS] = STATUSES.index("failed")
+                    return
+                counters[STATUS] = STATUSES.index("reconnecting")
+                counters[RECONNECTS] += 1
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+
+            if not is_file:
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, camera["capture_size"][0])
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, camera["capture_size"][1])
+            frame_interval = 0
+            if is_file and camera["realtime"]:
+                frame_interval = 1.0 / (cap.get(cv2.CAP_PROP_FPS) or 30)
+            counters[STATUS] = STATUSES.index("running")
+
+            next_frame_at = time.monotonic()
+            while not stop.is_set():
+                if slot is None:
+                    try:
+                        slot = free_slots.get_nowait()
+                    except queue.Empty:
+                        slot = None
+
+                if slot is not None and shape is not None and ring.fits(shape):
+                    # Decode straight into shared memory
+                    ret, frame = cap.read(ring.view(slot, shape))
+                else:
+                    ret, frame = cap.read()
+                if not ret:
+                    break
+                backoff = 1
+                shape = frame.shape
+
+                now = time.monotonic()
+                counters[FRAMES] += 1
+                counters[LAST_FRAME_AT] = time.time()
+                window_frames += 1
+                if now - window_start >= 1:
+                    counters[FPS] = round(window_frames / (now - window_start), 1)
+                    window_start, window_frames = now, 0
+
+                # Detection feedback from the worker tightens or relaxes the stride
+                if counters[RESULTS] != results_seen:
+                    results_seen = counters[RESULTS]
+                    gate.report(bool(counters[FOUND]))
+
+                if gate.should_infer(frame):
+                    if slot is None:
+                        counters[DROPPED] += 1
+                    else:
+                        if not ring.fits(shape):
+                            # Bigger than capture_size: shrink into the slot (set capture_size to match the camera)
+                            scale = (ring.slot_bytes / float(frame.size)) ** 0.5
+                            frame = cv2.resize(frame, (int(shape[1] * scale), int(shape[0] * scale)),
+                                               interpolation=cv2.INTER_AREA)
+                        target = ring.view(slot, frame.shape)
+                        if frame.ctypes.data != target.ctypes.data:
+                            target[...] = frame
+                        ready.put((camera["id"], slot, frame.shape, time.time(), gate.moving))
+                        counters[SUBMITTED] += 1
+                        slot = None
+                counters[STRIDE] = gate.stride
+
+                if frame_interval:
+                    next_frame_at += frame_interval
+                    time.sleep(max(0, next_frame_at - time.monotonic()))
+            cap.release()
+
+            if stop.is_set():
+                break
+            if is_file and not camera["loop"]:
+                counters[STATUS] = STATUSES.index("finished")
+                return
+            if not is_file:
+                counters[STATUS] = STATUSES.index("reconnecting")
+                counters[RECONNECTS] += 1
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+        counters[STATUS] = STATUSES.index("stopped")
+    finally:
+        counters[FPS] = 0
+        ring.close()
+
+
+# ==== Inference Worker Process ====
+def inference_worker(cameras, ring_specs, free_slots, ready, results, counters, stop, anpr_options,
+                     detect_requests=None, detect_replies=None, shard=0):
+    """Detect, track and OCR frames from the ring for a fixed shard of cameras
+
+    Every camera is served by exactly one worker, so its PlateTracker sees
+    all of its frames in order. Only the detections go back to the parent.
+
+    With ``detect_requests``, YOLO runs in the shared detector pool
+    (``detector_worker``) instead: frames are sent there as they arrive,
+    and their plates are tracked and read strictly in arrival order as the
+    replies come back on ``detect_replies``, so several frames are in
+    detection at once while OCR and tracking stay ordered.
+    """
+    from integrated_anpr_parking import ANPRSystem
+    from plate_tracker import PlateTracker
+
+    anpr_system = ANPRSystem(**anpr_options)
+    rings = {camera["id"]: FrameRing.attach(ring_specs[camera["id"]]) for camera in cameras}
+    regions = {camera["id"]: DetectionRegion.from_config(camera) for camera in cameras}
+    trackers = {camera["id"]: PlateTracker() for camera in cameras}
+    locations = {camera["id"]: camera["location"] for camera in cameras}
+
+    def finish(camera_id, slot, shape, captured_at, plates):
+        read, finished = [], []
+        try:
+            frame = rings[camera_id].view(slot, shape)
+            to_read, finished = trackers[camera_id].update(plates, captured_at)
+            read = anpr_system.read_plates(frame, to_read)
+            del frame
+        except Exception as e:
+            print(f"Error in ANPR worker ({camera_id}): {e}")
+        finally:
+            # Crops are views into the slot, so it is only handed back once OCR is done
+            free_slots[camera_id].put(slot)
+
+        camera_counters = counters[camera_id]
+        camera_counters[FOUND] = 1 if plates else 0
+        camera_counters[RESULTS] += 1
+
+        detection_time = datetime.fromtimestamp(captured_at).strftime('%Y-%m-%d %H:%M:%S')
+        for detection in read:
+            detection["detection_time"] = detection_time
+            detection["captured_at"] = captured_at
+            detection["source"] = camera_id
+            detection["camera_location"] = locations[camera_id]
+        detections = finished + trackers[camera_id].record(read)
+        if detections:
+            results.put(detections)
+
+    pending = {}  # sequence number -> frame waiting for the detector pool
+    detected = {}  # sequence number -> plates, until every earlier frame is done
+    sequence = next_sequence = 0
+    try:
+        while not stop.is_set():
+            try:
+                camera_id, slot, shape, captured_at, moving = ready.get(timeout=0.01 if pending else 0.2)
+            except queue.Empty:
+                pass
+            else:
+                # Climb the size ladder only for motion in the region or a car already being tracked
+                escalate = moving or bool(trackers[camera_id].tracks)
+                if detect_requests is None:
+                    plates = []
+                    try:
+                        frame = rings[camera_id].view(slot, shape)
+                        plates = regions[camera_id].detect(frame, anpr_system.detect_plates, escalate=escalate)
+                        del frame
+                    except Exception as e:
+                        print(f"Error in ANPR worker ({camera_id}): {e}")
+                    finish(camera_id, slot, shape, captured_at, plates)
+                else:
+                    pending[sequence] = (camera_id, slot, shape, captured_at)
+                    detect_requests.put((shard, sequence, camera_id, slot, shape, escalate))
+                    sequence += 1
+
+            if detect_replies is not None:
+                while True:
+                    try:
+                        done, plates = detect_replies.get_nowait()
+                    except queue.Empty:
+                        break
+                    detected[done] = plates
+                while next_sequence in detected:
+                    finish(*pending.pop(next_sequence), detected.pop(next_sequence))
+                    next_sequence += 1
+    finally:
+        for ring in rings.values():
+            ring.close()
+
+
+def detector_worker(cameras, ring_specs, requests, replies, stop, anpr_options):
+    """Shared YOLO process: detect on any camera's frame and reply to the worker that owns it
+
+    Detectors keep no per-camera state, so any number of them can serve
+    one camera; ordering is restored by the owning ``inference_worker``.
+    Every request gets a reply, with no plates if detection failed, so
+    the owner never waits on a lost frame.
+    """
+    from integrated_anpr_parking import ANPRSystem
+
+    anpr_system = ANPRSystem(**anpr_options)
+    rings = {camera["id"]: FrameRing.attach(ring_specs[camera["id"]]) for camera in cameras}
+    regions = {camera["id"]: DetectionRegion.from_config(camera) for camera in cameras}
+
+    try:
+        while not stop.is_set():
+            try:
+                shard, sequence, camera_id, slot, shape, escalate = requests.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            plates = []
+            try:
+                frame = rings[camera_id].view(slot, shape)
+                plates = regions[camera_id].detect(frame, anpr_system.detect_plates, escalate=escalate)
+                del frame
+            except Exception as e:
+                print(f"Error in ANPR detector ({camera_id}): {e}")
+            replies[shard].put((sequence, plates))
+    finally:
+        for ring in rings.values():
+            ring.close()
+
+
+# ==== Multi-process ANPR ====
+class MultiprocessANPR:
+    """capture processes → shared-memory rings → detector/OCR worker processes → decisions here
+
+    One capture process and one FrameRing per camera; up to one inference
+    process per camera (each with its own ANPRSystem) splits the cameras
+    between them. An explicit ``workers`` larger than the camera count
+    spends the extra processes on a shared detector pool, so even a
+    single camera can run YOLO on several cores while its tracking and
+    OCR stay in order in one process. Frames never leave shared memory:
+    queues carry (camera, slot, shape, time) tuples one way and
+    detections the other. This process
+    only runs the parking decision and persistence stages of an
+    ANPRPipeline, so the Python-side vision work scales across cores
+    instead of sharing one GIL.
+    """
+
+    def __init__(self, db, cameras, workers=None, slots=4, anpr_options=None, detection_cooldown=10,
+                 on_result=None):
+        self.db = db
+        self.cameras = list(cameras)
+        # Tracking and OCR need every frame of a camera in one process, so those shards stop at the
+        # camera count; only an explicit ``workers`` beyond it starts detectors (each loads its own models)
+        self.workers = max(1, min(workers or os.cpu_count() or 1, len(self.cameras)))
+        self.detect_workers = max(0, workers - self.workers) if workers else 0
+        self.slots = slots
+        self.anpr_options = anpr_options or {}
+        self.detection_cooldown = detection_cooldown
+        self.on_result = on_result
+        self.pipeline = None
+        self._processes = []
+        self._rings = {}
+        self._counters = {}
+        self._forwarder = None
+        self._stop = None
+
+    def start(self):
+        ctx = mp.get_context("spawn")  # torch and CUDA don't survive fork
+        self._stop = ctx.Event()
+        results = ctx.Queue()
+        ready = [ctx.Queue() for _ in range(self.workers)]
+        free_slots = {}
+
+        for camera in self.cameras:
+            width, height = camera["capture_size"]
+            ring = FrameRing(self.slots, (height, width, 3))
+            self._rings[camera["id"]] = ring
+            free_slots[camera["id"]] = ctx.Queue()
+            for slot in range(self.slots):
+                free_slots[camera["id"]].put(slot)
+            self._counters[camera["id"]] = ctx.Array('d', CAMERA_FIELDS, lock=False)
+
+        ring_specs = {camera_id: ring.spec for camera_id, ring in self._rings.items()}
+        detect_requests = ctx.Queue() if self.detect_workers else None
+        detect_replies = [ctx.Queue() for _ in range(self.workers)] if self.detect_workers else None
+        for worker in range(self.detect_workers):
+            process = ctx.Process(target=detector_worker, name=f"anpr-detector-{worker}", daemon=True,
+                                  args=(self.cameras, ring_specs, detect_requests, detect_replies, self._stop,
+                                        self.anpr_options))
+            self._processes.append(process)
+        for worker in range(self.workers):
+            shard = self.cameras[worker::self.workers]
+            process = ctx.Process(target=inference_worker, name=f"anpr-worker-{worker}", daemon=True,
+                                  args=(shard, ring_specs, free_slots, ready[worker], results,
+                                        self._counters, self._stop, self.anpr_options, detect_requests,
+                                        detect_replies[worker] if detect_replies else None, worker))
+            self._processes.append(process)
+        for index, camera in enumerate(self.cameras):
+            process = ctx.Process(target=capture_process, name=f"anpr-capture-{camera['id']}", daemon=True,
+                                  args=(camera, ring_specs[camera["id"]], free_slots[camera["id"]],
+                                        ready[index % self.workers], self._counters[camera["id"]], self._stop))
+            self._processes.append(process)
+
+        self.pipeline = ANPRPipeline(None, self.db, detection_cooldown=self.detection_cooldown, vision=False,
+                                     detection_log=self.db,
+                                     on_result=self.on_result)
+        self.pipeline.start()
+        for process in self._processes:
+            process.start()
+        self._forwarder = threading.Thread(target=self._forward, args=(results, self._stop),
+                                           name="anpr-results", daemon=True)
+        self._forwarder.start()
+
+    def stop(self, timeout=5):
+        if self._stop is None:
+            return
+        self._stop.set()
+        for process in self._processes:
+            process.join(timeout=timeout)
+            if process.is_alive():
+                process.terminate()
+        self._forwarder.join(timeout=timeout)
+        self.pipeline.stop()
+        for ring in self._rings.values():
+            ring.close()
+        self._processes, self._rings = [], {}
+        self._stop = None
+
+    def camera_stats(self):
+        """Capture health per camera, in the same shape as ANPRParkingIntegration.get_camera_stats"""
+        stats = {}
+        for camera in self.cameras:
+            counters = self._counters.get(camera["id"])
+            if counters is None:
+                continue
+            stats[camera["id"]] = {
+                "location": camera["location"], "zone": camera["zone"], "source": str(camera["source"]),
+                "status": STATUSES[int(counters[STATUS])], "frames": int(counters[FRAMES]),
+                "fps": counters[FPS], "reconnects": int(counters[RECONNECTS]),
+                "last_frame_at": counters[LAST_FRAME_AT] or None, "error": None,
+                "inferred": int(counters[SUBMITTED]), "dropped": int(counters[DROPPED]),
+                "stride": int(counters[STRIDE]) or None,
+            }
+        return stats
+
+    def _forward(self, results, stop):
+        while not stop.is_set():
+            try:
+                detections = results.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            self.pipeline.submit_detections(detections)
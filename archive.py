@@ -0,0 +1,201 @@
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from storage import TABLES, apply_schema
+
+try:
+    import pyarrow  # noqa: F401 - only needed for the Parquet format
+except ImportError:
+    pyarrow = None
+
+
+PARTITION_RE = re.compile(r"^(\d{4})-(\d{2})\.(parquet|npz)$")
+
+
+# ==== Columnar Archive ====
+class HistoryArchive:
+    """Month-partitioned columnar store for finished reservations and old detections
+
+    Each table gets a folder with one file per month of its archive date
+    column (``archive/reservations/2025-06.parquet``). Files are Parquet when
+    pyarrow is installed, otherwise compressed NumPy archives with one array
+    per column. Reads only open the months that overlap the requested date
+    range and only load the requested columns.
+    """
+
+    def __init__(self, root, fmt=None):
+        self.root = root
+        self.fmt = fmt or ("parquet" if pyarrow is not None else "npz")
+        self._lock = threading.RLock()
+
+    def _dir(self, table):
+        return os.path.join(self.root, table)
+
+    def partitions(self, table):
+        """``{"YYYY-MM": path}`` of every archived month"""
+        folder = self._dir(table)
+        if not os.path.isdir(folder):
+            return {}
+        found = {}
+        for name in sorted(os.listdir(folder)):
+            match = PARTITION_RE.match(name)
+            if match:
+                found[f"{match.group(1)}-{match.group(2)}"] = os.path.join(folder, name)
+        return found
+
+    def append(self, table, df):
+        """Add rows to their month partitions (re-adding identical rows is a no-op)"""
+        date_column = TABLES[table]["archive"]["date"]
+        df = df[df[date_column].notna()]
+        if df.empty:
+            return
+        with self._lock:
+            os.makedirs(self._dir(table), exist_ok=True)
+            existing = self.partitions(table)
+            for month, rows in df.groupby(df[date_column].dt.strftime("%Y-%m"), sort=True):
+                old_path = existing.get(month)
+                if old_path:
+                    rows = pd.concat([_read_file(old_path), rows], ignore_index=True).drop_duplicates()
+                rows = apply_schema(table, rows.reset_index(drop=True))
+                path = os.path.join(self._dir(table), f"{month}.{self.fmt}")
+                tmp_path = os.path.join(self._dir(table), f"{month}.tmp.{self.fmt}")
+                _write_file(rows, tmp_path, self.fmt)
+                os.replace(tmp_path, path)
+                if old_path and old_path != path:
+                    os.remove(old_path)
+
+    def read(self, table, columns=None, start=None, end=None):
+        """Archived rows with ``start <= date < end``, limited to ``columns``"""
+        date_column = TABLES[table]["archive"]["date"]
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+        frames = []
+        with self._lock:
+            for month, path in self.partitions(table).items():
+                month_start = pd.Timestamp(f"{month}-01")
+                month_end = month_start + pd.offsets.MonthBegin(1)
+                if (start is not None and month_end <= start) or (end is not None and month_start >= end):
+                    continue
+                frames.append(_read_file(path, columns, date_column, start, end))
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            names = columns or [name for name, _ in TABLES[table]["columns"]]
+            return apply_schema(table, pd.DataFrame(columns=names))
+        return apply_schema(table, pd.concat(frames, ignore_index=True))
+
+    def clear(self, table):
+        with self._lock:
+            for path in self.partitions(table).values():
+                os.remove(path)
+
+
+# ---- File formats ----
+def _write_file(df, path, fmt):
+    if fmt == "parquet":
+        df.to_parquet(path, index=False)
+        return
+    arrays = {}
+    for column in df.columns:
+        series = df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            arrays[f"{column}|codes"] = series.cat.codes.to_numpy()
+            arrays[f"{column}|categories"] = series.cat.categories.astype(str).to_numpy(dtype=str)
+        elif pd.api.types.is_datetime64_dtype(series):
+            arrays[f"{column}|datetime"] = series.to_numpy(dtype="datetime64[ns]").view("int64")
+        elif series.dtype == "Int64":
+            arrays[f"{column}|int"] = series.fillna(0).to_numpy(dtype="int64")
+            arrays[f"{column}|mask"] = series.isna().to_numpy()
+        elif series.dtype == bool or pd.api.types.is_float_dtype(series):
+            arrays[f"{column}|values"] = series.to_numpy()
+        else:
+            arrays[f"{column}|text"] = series.fillna("").astype(str).to_numpy(dtype=str)
+            arrays[f"{column}|mask"] = series.isna().to_numpy()
+    with open(path, "wb") as f:
+        np.savez_compressed(f, **arrays)
+
+
+def _read_file(path, columns=None, date_column=None, start=None, end=None):
+    if path.endswith(".parquet"):
+        filters = []
+        if start is not None:
+            filters.append((date_column, ">=", start))
+        if end is not None:
+            filters.append((date_column, "<", end))
+        return pd.read_parquet(path, columns=columns, filters=filters or None)
+
+    with np.load(path) as npz:
+        keys = {}
+        for key in npz.files:
+            column, kind = key.split("|")
+            keys.setdefault(column, {})[kind] = key
+        names = [c for c in (columns or keys) if c in keys]
+        rows = slice(None)
+        if start is not None or end is not None:
+            # Predicate first, so only the matching rows of other columns are materialized
+            dates = _column(npz, keys[date_column])
+            keep = np.ones(len(dates), dtype=bool)
+            if start is not None:
+                keep &= (dates >= start).to_numpy()
+            if end is not None:
+                keep &= (dates < end).to_numpy()
+            rows = keep
+        return pd.DataFrame({name: _column(npz, keys[name])[rows].reset_index(drop=True) for name in names})
+
+
+def _column(npz, kinds):
+    if "codes" in kinds:
+        return pd.Series(pd.Categorical.from_codes(npz[kinds["codes"]], npz[kinds["categories"]]))
+    if "datetime" in kinds:
+        return pd.Series(npz[kinds["datetime"]].view("datetime64[ns]"))
+    if "int" in kinds:
+        return pd.Series(pd.arrays.IntegerArray(npz[kinds["int"]], npz[kinds["mask"]]))
+    if "text" in kinds:
+        values = npz[kinds["text"]].astype(object)
+        values[npz[kinds["mask"]]] = np.nan
+        return pd.Series(values)
+    return pd.Series(npz[kinds["values"]])
+
+
+# ==== Hot/Cold Helpers ====
+def archive_table(storage, archive, table, keep_days=7, now=None):
+    """Move finished rows older than ``keep_days`` out of the hot table; returns how many moved"""
+    spec = TABLES[table]["archive"]
+    df = storage.read(table)
+    if df.empty:
+        return 0
+    cutoff = (now or datetime.now()) - timedelta(days=keep_days)
+    old = df[spec["date"]] < cutoff
+    if "statuses" in spec:
+        old &= df["status"].isin(spec["statuses"])
+    if "id" in df.columns:
+        # The newest row stays hot so next_id() keeps counting up from it
+        old &= (df["id"] != df["id"].max()).fillna(False)
+    old = old.to_numpy(dtype=bool)
+    if not old.any():
+        return 0
+    # Archive first: if we stop before the rewrite, re-archiving the same rows is a no-op
+    archive.append(table, df[old])
+    storage.create(table, df[~old].reset_index(drop=True))
+    return int(old.sum())
+
+
+def read_history(storage, archive, table, columns=None, start=None, end=None):
+    """Archived plus live rows of ``table``, with the same projection and date range"""
+    date_column = TABLES[table]["archive"]["date"]
+    hot = storage.read(table)
+    if start is not None:
+        hot = hot[(hot[date_column] >= pd.Timestamp(start)).to_numpy(dtype=bool)]
+    if end is not None:
+        hot = hot[(hot[date_column] < pd.Timestamp(end)).to_numpy(dtype=bool)]
+    if columns:
+        hot = hot[columns]
+    cold = archive.read(table, columns, start, end)
+    frames = [frame for frame in (cold, hot) if not frame.empty]
+    if not frames:
+        return hot
+    return apply_schema(table, pd.concat(frames, ignore_index=True))
@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+
+CAMERA_CONFIG_FILE = os.path.join("parking_data", "cameras.json")
+
+# Used for any setting a camera doesn't override: whole frame, YOLO at 640,
+# motion-gated sampling every 2nd to 10th moving frame
+DEFAULT_CAMERA = {
+    "source": None,
+    "location": "",
+    "zone": None,
+    "enabled": True,
+    "rois": [],
+    "detect_sizes": [640],
+    "capture_size": [1280, 720],
+    "sampling": {"motion": True, "min_stride": 2, "max_stride": 10, "heartbeat": 300},
+    # Video files only: play at the file's own frame rate, and start over at the end
+    "realtime": True,
+    "loop": False,
+}
+
+
+def parse_source(source):
+    """Device indexes stay ints; file paths and RTSP/HTTP URLs stay strings"""
+    if isinstance(source, str) and source.strip().isdigit():
+        return int(source.strip())
+    return source
+
+
+def is_file_source(source):
+    return isinstance(source, str) and "://" not in source
+
+
+# ==== Camera Registry ====
+class CameraRegistry:
+    """The cameras ANPR can monitor, kept in cameras.json
+
+    The file maps camera ids to their settings::
+
+        {"cameras": {"gate-in": {"source": "rtsp://10.0.0.5/stream1", "location": "Main gate",
+                                 "zone": "A", "rois": [[[400, 300], [900, 300], [1000, 720], [300, 720]]],
+                                 "detect_sizes": [320, 640], "capture_size": [1920, 1080],
+                                 "sampling": {"min_stride": 1, "max_stride": 8}}}}
+
+    ``source`` is a device index, a video file or a stream URL (a numeric
+    camera id with no source is that device index). ``rois`` are polygons
+    in full-resolution pixels (gate lane, barrier area); ``detect_sizes``
+    is the YOLO input-size ladder; ``sampling`` configures the camera's
+    MotionGate, or a fixed ``stride`` with ``"motion": false``.
+    """
+
+    def __init__(self, path=CAMERA_CONFIG_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        with self._lock:
+            self._cameras = {}
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    self._cameras = {str(camera_id): settings
+                                     for camera_id, settings in json.load(f).get("cameras", {}).items()}
+
+    def save(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({"cameras": self._cameras}, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def get(self, camera_id):
+        """Full settings for ``camera_id`` (registered or not), with defaults filled in"""
+        with self._lock:
+            settings = self._cameras.get(str(camera_id), {})
+        camera = dict(DEFAULT_CAMERA)
+        camera.update(settings)
+        camera["sampling"] = dict(DEFAULT_CAMERA["sampling"], **settings.get("sampling", {}))
+        camera["id"] = str(camera_id)
+        camera["source"] = parse_source(camera["source"] if camera["source"] is not None else camera_id)
+        return camera
+
+    def cameras(self, enabled_only=True):
+        with self._lock:
+            camera_ids = list(self._cameras)
+        cameras = [self.get(camera_id) for camera_id in camera_ids]
+        return [camera for camera in cameras if camera["enabled"] or not enabled_only]
+
+    def register(self, camera_id, source, location="", zone=None, **settings):
+        with self._lock:
+            entry = self._cameras.setdefault(str(camera_id), {})
+            entry.update(settings, source=source, location=location, zone=zone)
+        self.save()
+        return self.get(camera_id)
+
+    def remove(self, camera_id):
+        with self._lock:
+            removed = self._cameras.pop(str(camera_id), None)
+        if removed is not None:
+            self.save()
+        return removed is not None
+
+
+def load_camera_config(camera_id, path=CAMERA_CONFIG_FILE):
+    """Settings for one camera from cameras.json, filled in with DEFAULT_CAMERA"""
+    return CameraRegistry(path).get(camera_id)
+
+
+def camera_gate(camera):
+    """The MotionGate for a camera's sampling policy, with its ROIs as lanes"""
+    from motion_gate import MotionGate
+
+    sampling = camera["sampling"]
+    if not sampling.get("motion", True):
+        # Fixed stride: every frame counts as moving
+        stride = sampling.get("stride", sampling["min_stride"])
+        return MotionGate(min_changed=0, min_stride=stride, max_stride=stride, heartbeat=stride)
+    return MotionGate(lanes=camera["rois"], min_stride=sampling["min_stride"],
+                      max_stride=sampling["max_stride"], heartbeat=sampling["heartbeat"])
+
+
+# ==== Detection Region ====
+class DetectionRegion:
+    """Runs plate detection on a downscaled region of interest of a full-resolution frame
+
+    The frame is cut to the bounding rectangle of the ROI polygons,
+    shrunk so its long side is the current ``detect_sizes`` rung, and
+    blanked outside the polygons. Boxes are mapped back to full-frame
+    coordinates, so the plate crop for OCR still comes from the
+    full-resolution frame. If a rung finds nothing and ``escalate`` is set
+    (there was motion in the region or a plate is being tracked), the next
+    (larger) rung is tried before giving up; otherwise an empty frame costs
+    only the smallest rung.
+    """
+
+    def __init__(self, rois=None, detect_sizes=(640,)):
+        self.rois = [np.asarray(roi, dtype=np.float32) for roi in (rois or [])]
+        self.detect_sizes = sorted(int(size) for size in detect_sizes)
+        self.stats = {"frames": {size: 0 for size in self.detect_sizes}, "escalations": 0}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get("rois"), config.get("detect_sizes", DEFAULT_CAMERA["detect_sizes"]))
+
+    def bounds(self, frame_shape):
+        """(x1, y1, x2, y2) of the ROIs clipped to the frame, or the whole frame"""
+        height, width = frame_shape[:2]
+        if not self.rois:
+            return 0, 0, width, height
+        points = np.concatenate(self.rois)
+        x1, y1 = np.floor(points.min(axis=0)).astype(int)
+        x2, y2 = np.ceil(points.max(axis=0)).astype(int)
+        return max(0, x1), max(0, y1), min(width, x2), min(height, y2)
+
+    def prepare(self, frame, size):
+        """The image to run YOLO on at input size ``size``, and the transform back"""
+        import cv2  # cv2 only loads once detection starts; the registry is used by the UI
+
+        x1, y1, x2, y2 = self.bounds(frame.shape)
+        region = frame[y1:y2, x1:x2]
+        scale = min(1.0, size / float(max(region.shape[:2])))
+        if scale < 1.0:
+            region = cv2.resize(region, (max(1, int(region.shape[1] * scale)), max(1, int(region.shape[0] * scale))),
+                                interpolation=cv2.INTER_AREA)
+        if self.rois:
+            mask = np.zeros(region.shape[:2], dtype=np.uint8)
+            polygons = [np.round((roi - (x1, y1)) * scale).astype(np.int32) for roi in self.rois]
+            cv2.fillPoly(mask, polygons, 255)
+            region = cv2.bitwise_and(region, region, mask=mask)
+        return region, (x1, y1, scale, frame.shape[1], frame.shape[0])
+
+    @staticmethod
+    def to_frame(plates, transform):
+        """Map plate boxes from the prepared image back to full-frame pixels"""
+        ox, oy, scale, width, height = transform
+        mapped = []
+        for plate_info in plates:
+            x1, y1, x2, y2 = plate_info['bbox']
+            bbox = (min(width, max(0, int(x1 / scale) + ox)), min(height, max(0, int(y1 / scale) + oy)),
+                    min(width, max(0, int(round(x2 / scale)) + ox)), min(height, max(0, int(round(y2 / scale)) + oy)))
+            mapped.append(dict(plate_info, bbox=bbox))
+        return mapped
+
+    def detect(self, frame, detect_fn, escalate=True):
+        """Detect plates with ``detect_fn(image, imgsz=...)``, climbing the size ladder on a miss if ``escalate``"""
+        plates = []
+        sizes = self.detect_sizes if escalate else self.detect_sizes[:1]
+        for rung, size in enumerate(sizes):
+            if rung > 0:
+                self.stats["escalations"] += 1
+            image, transform = self.prepare(frame, size)
+            self.stats["frames"][size] += 1
+            plates = self.to_frame(detect_fn(image, imgsz=size), transform)
+            if plates:
+                break
+        return plates
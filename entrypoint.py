@@ -5,6 +5,7 @@ import pandas as pd
 from difflib import SequenceMatcher
 import re
 import os
+from storage import format_timestamp, is_unlimited
 
 st.set_page_config(
     page_title="BASE-SmartPark",
@@ -32,13 +33,17 @@ from admin import (
 # Cache database
 @st.cache_resource
 def get_db():
-    return ParkingDatabase()
+    db = ParkingDatabase()
+    db.start_expiry_scheduler()
+    db.archive_history()
+    return db
 
 
 # Cache ANPR integration
 @st.cache_resource
 def get_anpr():
-    return get_anpr_integration()
+    # Share the cached database so the monitor thread sees the same indexes
+    return get_anpr_integration(get_db())
 
 
 # Init session state
@@ -135,14 +140,12 @@ def render_reservation_status_page(db):
         st.session_state.user_plate = plate.upper()
 
     if st.session_state.user_plate:
-        df = db.get_reservations_history()
-        res = df[df['plate_number'].str.upper() == st.session_state.user_plate]
+        latest = db.get_latest_reservation(st.session_state.user_plate)
 
-        if res.empty:
+        if latest is None:
             st.info("No reservation found for this plate.")
             return
 
-        latest = res.sort_values("created_at", ascending=False).iloc[0]
         status = latest['status']
         spot_id = latest['spot_id']
         duration = latest['duration_minutes']
@@ -164,9 +167,7 @@ def render_reservation_status_page(db):
 
             # Cancel it if over time
             if minutes_waiting > 30:
-                df.loc[res.index[-1], 'status'] = 'cancelled'
-                db.update_spot_status(spot_id, 'available')
-                df.to_csv(db.reservations_file, index=False)
+                db.cancel_reservation(latest['id'], spot_id)
                 st.error("❌ Reservation cancelled due to no ANPR detection.")
                 return
 
@@ -182,7 +183,8 @@ def render_reservation_status_page(db):
                 mins = int(remaining.total_seconds() // 60)
                 secs = int(remaining.total_seconds() % 60)
                 st.info(f"⏳ Time remaining: **{mins} min {secs} sec**")
-                st.caption(f"📅 Total Duration: {duration} min")
+                st.caption("📅 Total Duration: Unlimited" if is_unlimited(duration)
+                           else f"📅 Total Duration: {duration} min")
 
         elif status == "cancelled":
             st.error("❌ This reservation was cancelled.")
@@ -247,7 +249,6 @@ def generate_copilot_response(user_input: str, db) -> str:
 
     try:
         spots = db.get_parking_spots()
-        res = db.get_reservations_history()
 
         # SPECIFIC SPOT STATUS QUERIES (using regex for precision)
         if re.search(r'\b(how many|number of|count of|spots)\b.*\b(available|total|reserved|occupied|maintenance)\b',
@@ -284,6 +285,8 @@ def generate_copilot_response(user_input: str, db) -> str:
         elif matches_keywords(
                 ['busiest zone', 'most used zone', 'popular zone', 'busy area', 'zone stats']) or re.search(
             r'\b(most used zone|busiest zone|popular zone)\b', user_lower):
+            # Full history (archive + live), only the column this answer needs
+            res = db.reservation_history(columns=["spot_id"])
             if not res.empty:
                 res_copy = res.copy()
                 res_copy["zone"] = res_copy["spot_id"].astype(str).str[0]
@@ -299,6 +302,7 @@ def generate_copilot_response(user_input: str, db) -> str:
         # TIME ANALYSIS (with better error handling)
         elif matches_keywords(['busiest time', 'busy hour', 'peak time', 'rush hour', 'when busy']) or re.search(
                 r'\b(time|hour)\b.*\b(busy|busiest)\b', user_lower):
+            res = db.reservation_history(columns=["start_time"])
             if not res.empty:
                 res_copy = res.copy()
                 res_copy["hour"] = pd.to_datetime(res_copy["start_time"]).dt.hour
@@ -392,7 +396,7 @@ def render_admin_spot_grid(spots_df, db):
                                                       spot['status']))
                         new_plate = st.text_input("Plate Number", spot['plate_number'])
                         reserved_by = st.text_input("Reserved By", spot['reserved_by'])
-                        reserved_until = st.text_input("Reserved Until", spot['reserved_until'])
+                        reserved_until = st.text_input("Reserved Until", format_timestamp(spot['reserved_until']))
                         if st.form_submit_button("✅ Apply Changes"):
                             db.update_spot_status(spot['spot_id'], new_status, new_plate, reserved_by, reserved_until)
                             st.success(f"Updated {spot['spot_id']}")
@@ -430,7 +434,6 @@ def main():
     init_session()
     db = get_db()
     anpr_integration = get_anpr()  # ✅ Initialize ANPR integration
-    db.clean_expired_reservations()
 
     st.sidebar.title("🧭 SmartPark Navigation")
     pages = [
@@ -455,7 +458,6 @@ def main():
 
     # 🔄 Always get fresh data
     spots_df = db.get_parking_spots()
-    reservations_df = db.get_reservations_history()
 
     # 🚦 Page routing
     if selection == "🏠 Dashboard":
@@ -478,7 +480,7 @@ def main():
         render_user_login_page()
 
     elif selection == "📊 Analytics":
-        render_analytics_page(spots_df, reservations_df)
+        render_analytics_page(spots_df, db.reservation_history())
 
     elif selection == "🔧 System Settings":
         render_system_settings_page(db)
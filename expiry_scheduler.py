@@ -0,0 +1,108 @@
+import heapq
+import threading
+import time
+from datetime import datetime
+
+
+def to_timestamp(value):
+    """Epoch seconds for a datetime or ISO string, None if it can't be parsed"""
+    if value is None or value != value:  # None, NaN or NaT
+        return None
+    if hasattr(value, "to_pydatetime"):
+        # pandas treats naive Timestamps as UTC in .timestamp(); datetime uses local time
+        value = value.to_pydatetime()
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class ExpiryScheduler:
+    """Min-heap of reservation deadlines with a background thread that fires due ones
+
+    ``on_expire(ids)`` is called with the reservation ids whose end_time has
+    passed. Rescheduling or cancelling leaves the old heap entry behind; it
+    is skipped when popped because it no longer matches ``_deadlines``.
+    """
+
+    MAX_WAIT = 3600  # re-check at least hourly in case the wall clock jumps
+
+    def __init__(self, on_expire):
+        self.on_expire = on_expire
+        self._heap = []
+        self._deadlines = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def schedule(self, reservation_id, end_time):
+        deadline = to_timestamp(end_time)
+        if deadline is None:
+            return
+        with self._cond:
+            wake = not self._heap or deadline < self._heap[0][0]
+            self._deadlines[reservation_id] = deadline
+            heapq.heappush(self._heap, (deadline, reservation_id))
+            if wake:
+                self._cond.notify()
+
+    def cancel(self, reservation_id):
+        with self._cond:
+            self._deadlines.pop(reservation_id, None)
+
+    def clear(self):
+        with self._cond:
+            self._heap = []
+            self._deadlines = {}
+
+    def pop_due(self, now=None):
+        """Remove and return the ids of all reservations due at ``now``"""
+        now = time.time() if now is None else now
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, reservation_id = heapq.heappop(self._heap)
+                if self._deadlines.get(reservation_id) == deadline:
+                    del self._deadlines[reservation_id]
+                    due.append(reservation_id)
+        return due
+
+    def pending(self):
+        with self._cond:
+            return len(self._deadlines)
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                timeout = self.MAX_WAIT
+                if self._heap:
+                    timeout = min(max(self._heap[0][0] - time.time(), 0), self.MAX_WAIT)
+                if timeout > 0:
+                    self._cond.wait(timeout)
+                if not self._running:
+                    return
+            due = self.pop_due()
+            if due:
+                try:
+                    self.on_expire(due)
+                except Exception as e:
+                    print(f"Error expiring reservations: {e}")
@@ -0,0 +1,215 @@
+import heapq
+import threading
+
+
+def normalize_plate(plate):
+    """Canonical form used for plate lookups (case and whitespace insensitive)"""
+    if plate is None or plate != plate:  # None or NaN
+        return ""
+    return str(plate).strip().upper()
+
+
+# ==== Reservation Index ====
+class ReservationIndex:
+    """In-memory secondary indexes over the reservations table
+
+    Keeps every reservation row by id plus plate -> ids, status -> ids and
+    (plate, status) -> ids maps, so plate/status lookups never scan the
+    table. ParkingDatabase updates it on every reservation write.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.rows = {}
+            self.by_plate = {}
+            self.by_status = {}
+            self.by_plate_status = {}
+
+    def build(self, df):
+        """(Re)build all indexes from a reservations DataFrame"""
+        with self._lock:
+            self.clear()
+            if df is None or df.empty:
+                return
+            if "created_at" in df.columns:
+                df = df.sort_values(["created_at", "id"], kind="stable", na_position="first")
+            for row in df.to_dict("records"):
+                self.add(row)
+
+    def add(self, row):
+        with self._lock:
+            reservation_id = row["id"]
+            if reservation_id in self.rows:
+                self._unlink(reservation_id)
+            row = dict(row)
+            self.rows[reservation_id] = row
+            self._link(reservation_id, row)
+
+    def update(self, reservation_id, changes):
+        with self._lock:
+            row = self.rows.get(reservation_id)
+            if row is None:
+                return
+            self._unlink(reservation_id)
+            row.update(changes)
+            self._link(reservation_id, row)
+
+    def _link(self, reservation_id, row):
+        plate = normalize_plate(row.get("plate_number"))
+        status = row.get("status")
+        # dicts double as insertion-ordered sets: oldest reservation first
+        self.by_plate.setdefault(plate, {})[reservation_id] = None
+        self.by_status.setdefault(status, {})[reservation_id] = None
+        self.by_plate_status.setdefault((plate, status), {})[reservation_id] = None
+
+    def _unlink(self, reservation_id):
+        row = self.rows[reservation_id]
+        plate = normalize_plate(row.get("plate_number"))
+        status = row.get("status")
+        for index, key in ((self.by_plate, plate), (self.by_status, status),
+                           (self.by_plate_status, (plate, status))):
+            ids = index.get(key)
+            if ids is not None:
+                ids.pop(reservation_id, None)
+                if not ids:
+                    del index[key]
+
+    def get(self, reservation_id):
+        with self._lock:
+            row = self.rows.get(reservation_id)
+            return dict(row) if row is not None else None
+
+    def first(self, plate, status):
+        """Oldest reservation for a plate that is in the given status"""
+        with self._lock:
+            ids = self.by_plate_status.get((normalize_plate(plate), status))
+            if not ids:
+                return None
+            return dict(self.rows[next(iter(ids))])
+
+    def latest(self, plate):
+        """Most recently created reservation for a plate"""
+        with self._lock:
+            ids = self.by_plate.get(normalize_plate(plate))
+            if not ids:
+                return None
+            return dict(self.rows[next(reversed(ids))])
+
+    def with_status(self, status):
+        with self._lock:
+            return [dict(self.rows[i]) for i in self.by_status.get(status, {})]
+
+    def count(self, status=None):
+        with self._lock:
+            if status is None:
+                return len(self.rows)
+            return len(self.by_status.get(status, {}))
+
+
+# ==== Free Spot Index ====
+class FreeSpotIndex:
+    """Per-zone free lists of available parking spots
+
+    Each zone keeps an insertion-ordered set of free spot ids plus a min-heap
+    over the same ids (stale heap entries are skipped lazily), so allocation
+    never scans the spots table:
+
+    - ``"lowest"``: lowest spot number first (B01 before B02), O(log n)
+    - ``"fifo"``: the spot that has been free the longest, O(1)
+
+    All operations hold one lock, so two callers can never allocate the
+    same spot.
+    """
+
+    POLICIES = ("lowest", "fifo")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._free = {}
+        self._heaps = {}
+        self._zone_of = {}
+        self.zone_order = []
+
+    def build(self, spots_df):
+        """(Re)build from a parking spots DataFrame"""
+        with self._lock:
+            self._free = {}
+            self._heaps = {}
+            self._zone_of = {}
+            self.zone_order = []
+            if spots_df is None or spots_df.empty:
+                return
+            for spot_id, zone, status in spots_df[["spot_id", "zone", "status"]].itertuples(index=False):
+                if zone not in self._free:
+                    self._free[zone] = {}
+                    self._heaps[zone] = []
+                    self.zone_order.append(zone)
+                self._zone_of[spot_id] = zone
+                if status == "available":
+                    self._free[zone][spot_id] = None
+            for zone, free in self._free.items():
+                self._heaps[zone] = sorted(free)
+
+    def _zone(self, spot_id):
+        zone = self._zone_of.get(spot_id)
+        if zone is None:
+            zone = str(spot_id)[0]
+            self._zone_of[spot_id] = zone
+        if zone not in self._free:
+            self._free[zone] = {}
+            self._heaps[zone] = []
+            self.zone_order.append(zone)
+        return zone
+
+    def allocate(self, zone=None, policy="lowest"):
+        """Take a free spot out of the index and return its id (None if full)"""
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown allocation policy: {policy}")
+        with self._lock:
+            zones = [zone] if zone is not None else self.zone_order
+            for z in zones:
+                free = self._free.get(z)
+                if not free:
+                    continue
+                if policy == "fifo":
+                    spot_id = next(iter(free))
+                else:
+                    heap = self._heaps[z]
+                    spot_id = heapq.heappop(heap)
+                    while spot_id not in free:
+                        spot_id = heapq.heappop(heap)
+                del free[spot_id]
+                return spot_id
+            return None
+
+    def release(self, spot_id):
+        """Mark a spot as free again"""
+        with self._lock:
+            zone = self._zone(spot_id)
+            free = self._free[zone]
+            if spot_id in free:
+                return
+            free[spot_id] = None
+            heap = self._heaps[zone]
+            heapq.heappush(heap, spot_id)
+            if len(heap) > 2 * len(free) + 64:
+                self._heaps[zone] = sorted(free)
+
+    def discard(self, spot_id):
+        """Mark a spot as taken (reserved, occupied or in maintenance)"""
+        with self._lock:
+            self._free.get(self._zone(spot_id), {}).pop(spot_id, None)
+
+    def is_free(self, spot_id):
+        with self._lock:
+            return spot_id in self._free.get(self._zone_of.get(spot_id), {})
+
+    def count(self, zone=None):
+        with self._lock:
+            if zone is not None:
+                return len(self._free.get(zone, {}))
+            return sum(len(free) for free in self._free.values())
@@ -1,18 +1,96 @@
 import cv2
 import numpy as np
 import pandas as pd
-import easyocr
 import re
 from datetime import datetime
 import os
 from pathlib import Path
 import logging
-from ultralytics import YOLO
+import threading
 import time
+from storage import read_table_csv, write_table_csv, apply_schema
+from plate_tracker import PlateTracker
+from motion_gate import MotionGate
+from camera_config import DetectionRegion, camera_gate, load_camera_config
+from anpr_backends import MODEL_DIR, backend_model_path, load_recognizer
+from anpr_metrics import Metrics
+
+
+class DetectionLog:
+    """Appends ANPR detections to anpr_detections.csv
+
+    Needs no models. This is the log of the standalone ANPRSystem; the web
+    app records detections through ParkingDatabase.save_detections instead,
+    so they go through its storage and writer thread.
+    """
+
+    def __init__(self, csv_file, logger=None):
+        self.csv_file = csv_file
+        self.logger = logger or logging.getLogger(__name__)
+
+    def save_detections(self, detections):
+        """Save detections to CSV file"""
+        try:
+            # Load existing data
+            if os.path.exists(self.csv_file):
+                existing_df = read_table_csv(self.csv_file, "anpr_detections")
+                next_id = int(existing_df['id'].max()) + 1 if not existing_df.empty else 1
+            else:
+                existing_df = pd.DataFrame()
+                next_id = 1
+
+            # Prepare new data
+            new_data = []
+            for detection in detections:
+                new_data.append({
+                    'id': next_id,
+                    'plate_number': detection['plate_number'],
+                    'confidence': detection['confidence'],
+                    'detection_time': detection['detection_time'],
+                    'camera_location': detection.get('camera_location', ''),
+                    'is_emergency': detection['is_emergency'],
+                    'processed': False
+                })
+                next_id += 1
+
+            # Create DataFrame and append
+            new_df = pd.DataFrame(new_data)
+            final_df = pd.concat([existing_df, new_df], ignore_index=True)
+
+            # Remove duplicates based on plate number and time (within 5 seconds)
+            final_df = apply_schema("anpr_detections", final_df)
+            final_df = final_df.sort_values('detection_time')
+
+            # Save to CSV
+            write_table_csv(final_df, self.csv_file, "anpr_detections")
+            self.logger.info(f"Saved {len(new_data)} detections to {self.csv_file}")
+
+        except Exception as e:
+            self.logger.error(f"Error saving detections: {e}")
 
 
 class ANPRSystem:
-    def __init__(self, yolo_model_path="yolov8n.pt", confidence_threshold=0.7, ocr_confidence_threshold=0.6):
+    # OCR preprocessing variants, cheapest first: the raw crop, a 2x bicubic
+    # upscale, then the denoise + threshold pass whose fastNlMeansDenoising
+    # dominates the cost of extract_text. get_ocr_stats() reports the real costs.
+    OCR_VARIANTS = ("original", "upscaled", "enhanced")
+
+    # Input height of EasyOCR's recognizer; crops are resized to it
+    OCR_MODEL_HEIGHT = 64
+
+    # Default license plate validation patterns (customize for your region)
+    PLATE_PATTERNS = (
+        r'^[A-Z]{2}\d{2}[A-Z]{3}$',  # UK format: AB12CDE
+        r'^[A-Z]{3}\d{4}$',  # USA format: ABC1234
+        r'^\d{3}[A-Z]{3}$',  # Format: 123ABC
+        r'^[A-Z]{2}\d{4}[A-Z]{2}$',  # Format: AB1234CD
+        r'^[A-Z]{1}\d{3}[A-Z]{3}$',  # Format: A123BCD
+        r'^[A-Z]{3}\d{3}$',  # Format: ABC123
+    )
+
+    def __init__(self, yolo_model_path="yolov8n.pt", confidence_threshold=0.7, ocr_confidence_threshold=0.6,
+                 ocr_variants=OCR_VARIANTS, ocr_early_exit_confidence=0.8, backend=None, model_dir=MODEL_DIR,
+                 metrics=None):
         """
         Initialize ANPR System
 
@@ -20,35 +98,73 @@ class ANPRSystem:
             yolo_model_path: Path to YOLO model for license plate detection
             confidence_threshold: Minimum confidence for plate detection
             ocr_confidence_threshold: Minimum confidence for OCR text recognition
+            ocr_variants: Order in which extract_text tries the OCR preprocessing variants
+            ocr_early_exit_confidence: A valid plate read at or above this confidence
+                stops extract_text before the remaining variants
+            backend: "torch" (default, or SMARTPARK_ANPR_BACKEND), "onnx", "onnx-int8" or
+                "openvino"; the others load models exported by anpr_backends.py
+            model_dir: Where the exported models are
+            metrics: Metrics that the per-stage timers feed (a private one by default)
         """
         # Setup logging
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
         self.logger = logging.getLogger(__name__)
 
+        self.backend = backend or os.environ.get("SMARTPARK_ANPR_BACKEND", "torch")
+        if self.backend != "torch":
+            yolo_model_path = backend_model_path(self.backend, "detector", model_dir)
+
+        # Imported here so that loading this module (e.g. for DetectionLog) stays cheap
+        import easyocr
+        from ultralytics import YOLO
+
         # Initialize YOLO model
         try:
-            self.yolo_model = YOLO(yolo_model_path)
+            self.yolo_model = YOLO(yolo_model_path, task="detect")
             self.logger.info(f"YOLO model loaded: {yolo_model_path}")
         except Exception as e:
             self.logger.error(f"Failed to load YOLO model: {e}")
             raise
 
         # Initialize EasyOCR
-        try:
-            self.ocr_reader = easyocr.Reader(['en'], gpu=True)  # Use GPU if available
-            self.logger.info("EasyOCR initialized successfully")
-        except Exception as e:
-            self.logger.warning(f"GPU not available, using CPU for OCR: {e}")
+        if self.backend != "torch":
+            # Exported backends are for CPU; EasyOCR keeps its decoding, the recognizer runs in
+            # ONNX Runtime (or OpenVINO for the openvino backend)
             self.ocr_reader = easyocr.Reader(['en'], gpu=False)
+            self.ocr_reader.recognizer = load_recognizer(self.backend, model_dir)
+            self.logger.info(f"EasyOCR initialized with the {self.backend} recognizer")
+        else:
+            try:
+                self.ocr_reader = easyocr.Reader(['en'], gpu=True)  # Use GPU if available
+                self.logger.info("EasyOCR initialized successfully")
+            except Exception as e:
+                self.logger.warning(f"GPU not available, using CPU for OCR: {e}")
+                self.ocr_reader = easyocr.Reader(['en'], gpu=False)
 
         # Configuration
         self.confidence_threshold = confidence_threshold
         self.ocr_confidence_threshold = ocr_confidence_threshold
+        self.ocr_early_exit_confidence = ocr_early_exit_confidence
+
+        # OCR cascade
+        self._ocr_preprocessors = {
+            "original": lambda img, metrics=None: img,
+            "upscaled": lambda img, metrics=None: cv2.resize(img, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC),
+            "enhanced": self._enhance_plate_image,
+        }
+        unknown = [name for name in ocr_variants if name not in self._ocr_preprocessors]
+        if unknown:
+            raise ValueError(f"Unknown OCR variants: {unknown}")
+        self.ocr_variants = list(ocr_variants)
+        self._ocr_stats_lock = threading.Lock()
+        self.reset_ocr_stats()
+        self.metrics = metrics or Metrics()
 
         # Create parking_data folder if it doesn't exist
         self.data_folder = "parking_data"
         os.makedirs(self.data_folder, exist_ok=True)
         self.csv_file = os.path.join(self.data_folder, "anpr_detections.csv")
+        self.detection_log = DetectionLog(self.csv_file, self.logger)
 
         # Emergency vehicle patterns (can be customized)
         self.emergency_patterns = [
@@ -57,14 +173,7 @@ class ANPRSystem:
         ]
 
         # License plate validation patterns (customize for your region)
-        self.plate_patterns = [
-            r'^[A-Z]{2}\d{2}[A-Z]{3}$',  # UK format: AB12CDE
-            r'^[A-Z]{3}\d{4}$',  # USA format: ABC1234
-            r'^\d{3}[A-Z]{3}$',  # Format: 123ABC
-            r'^[A-Z]{2}\d{4}[A-Z]{2}$',  # Format: AB1234CD
-            r'^[A-Z]{1}\d{3}[A-Z]{3}$',  # Format: A123BCD
-            r'^[A-Z]{3}\d{3}$',  # Format: ABC123
-        ]
+        self.plate_patterns = list(self.PLATE_PATTERNS)
 
         # Initialize CSV file
         self._initialize_csv()
@@ -130,8 +239,8 @@ class ANPRSystem:
                 return True
         return False
 
-    def _enhance_plate_image(self, plate_img):
-        """Enhance the license plate image for better OCR"""
+    def _enhance_plate_image(self, plate_img, metrics=None):
+        """Enhance the license plate image for better OCR (timed into ``metrics``, default self.metrics)"""
         # Convert to grayscale
         if len(plate_img.shape) == 3:
             gray = cv2.cvtColor(plate_img, cv2.COLOR_BGR2GRAY)
@@ -139,7 +248,8 @@ class ANPRSystem:
             gray = plate_img
 
         # Apply denoising
-        denoised = cv2.fastNlMeansDenoising(gray)
+        with (metrics or self.metrics).timer("ocr.enhance.denoise"):
+            denoised = cv2.fastNlMeansDenoising(gray)
 
         # Apply adaptive thresholding
         thresh = cv2.adaptiveThreshold(denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
@@ -150,12 +260,26 @@ class ANPRSystem:
 
         return morphed
 
-    def detect_plates(self, image):
+    def detect_plates(self, image, imgsz=None):
         """Detect license plates in the image using YOLO"""
-        results = self.yolo_model(image, conf=self.confidence_threshold)
-        plates = []
+        return self.detect_plates_batch([image], imgsz=imgsz)[0]
+
+    def detect_plates_batch(self, images, imgsz=None, metrics=None):
+        """Detect license plates in several images with one batched YOLO call
+
+        ``imgsz`` overrides the model's input size (e.g. for a downscaled
+        ROI). Returns one list of plates per image, in the same order.
+        """
+        metrics = metrics or self.metrics
+        options = {"imgsz": imgsz} if imgsz else {}
+        images = list(images)
+        with metrics.timer("detect.yolo"):
+            results = self.yolo_model(images, conf=self.confidence_threshold, **options)
+        metrics.incr("detect.frames", len(images))
+        batch = []
 
         for result in results:
+            plates = []
             boxes = result.boxes
             if boxes is not None:
                 for box in boxes:
@@ -166,102 +290,246 @@ class ANPRSystem:
                             'bbox': (x1, y1, x2, y2),
                             'confidence': confidence
                         })
+            batch.append(plates)
 
-        return plates
+        return batch
 
     def extract_text(self, plate_image):
-        """Extract text from license plate using EasyOCR with multiple attempts"""
-        best_text = ""
-        best_confidence = 0
-
-        # Try with original image
-        results = self.ocr_reader.readtext(plate_image)
-        for (bbox, text, confidence) in results:
-            if confidence > best_confidence and len(text.strip()) >= 4:
-                best_text = text.strip()
-                best_confidence = confidence
-
-        # Try with enhanced image
-        enhanced_img = self._enhance_plate_image(plate_image)
-        enhanced_results = self.ocr_reader.readtext(enhanced_img)
-        for (bbox, text, confidence) in enhanced_results:
-            if confidence > best_confidence and len(text.strip()) >= 4:
-                best_text = text.strip()
-                best_confidence = confidence
-
-        # Try with different preprocessing
-        resized = cv2.resize(plate_image, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
-        resized_results = self.ocr_reader.readtext(resized)
-        for (bbox, text, confidence) in resized_results:
-            if confidence > best_confidence and len(text.strip()) >= 4:
-                best_text = text.strip()
-                best_confidence = confidence
-
-        return best_text, best_confidence
+        """Extract text from license plate using an early-exit EasyOCR cascade"""
+        return self.extract_text_batch([plate_image])[0]
+
+    def extract_text_batch(self, plate_images):
+        """Run the OCR cascade over several plate crops, one recognizer call per variant
+
+        The variants in ``ocr_variants`` are tried in order; a crop whose
+        read is a valid plate at ``ocr_early_exit_confidence`` or above
+        leaves the cascade, and only the remaining crops go on to the next
+        variant. Crops that never pass get their best read over all
+        variants. Returns one (text, confidence) per crop, in order.
+        """
+        best = [("", 0, None)] * len(plate_images)
+        pending = list(range(len(plate_images)))
+
+        for variant in self.ocr_variants:
+            if not pending:
+                break
+            preprocess = self._ocr_preprocessors[variant]
+            started = time.perf_counter()
+            reads = self._recognize_batch([preprocess(plate_images[i]) for i in pending])
+            elapsed = time.perf_counter() - started
+
+            still_pending = []
+            for i, results in zip(pending, reads):
+                best_text, best_confidence, best_variant = best[i]
+                for text, confidence in results:
+                    if confidence > best_confidence and len(text.strip()) >= 4:
+                        best_text, best_confidence, best_variant = text.strip(), confidence, variant
+                best[i] = (best_text, best_confidence, best_variant)
+
+                if not (best_variant == variant and best_confidence >= self.ocr_early_exit_confidence and
+                        self._validate_plate(self._clean_plate_text(best_text))):
+                    still_pending.append(i)
+            self._record_ocr_variant(variant, elapsed, len(pending), len(pending) - len(still_pending))
+            pending = still_pending
+
+        with self._ocr_stats_lock:
+            for i in pending:
+                if best[i][2] is not None:
+                    self._ocr_stats[best[i][2]]["best"] += 1
+        return [(text, confidence) for text, confidence, _ in best]
+
+    def _recognize_batch(self, images):
+        """Recognize several crops with one batched pass through EasyOCR's recognizer
+
+        ``Reader.recognize`` runs the recognizer once per box on CPU,
+        whatever its ``batch_size``, so the crops are resized the way it
+        would resize them (``get_image_list``) and go to ``get_text``
+        together. The text detector is skipped, since YOLO already found
+        the plate. Returns a list of (text, confidence) reads per image.
+        """
+        if not images:
+            return []
+        from easyocr.recognition import get_text
+        from easyocr.utils import get_image_list
+
+        reader = self.ocr_reader
+        image_list, max_width = [], 0
+        for img in images:
+            grey = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+            h, w = grey.shape[:2]
+            crops, width = get_image_list([[0, w, 0, h]], [], grey, model_height=self.OCR_MODEL_HEIGHT)
+            image_list.extend(crops)
+            max_width = max(max_width, width)
+
+        ignore_char = ''.join(set(reader.character) - set(reader.lang_char))
+        results = get_text(reader.character, self.OCR_MODEL_HEIGHT, int(max_width), reader.recognizer,
+                           reader.converter, image_list, ignore_char=ignore_char, decoder='greedy',
+                           batch_size=len(image_list), workers=0, device=reader.device)
+        # get_text answers once per crop, in the order given
+        reads = [[] for _ in images]
+        for i, (_, text, confidence) in enumerate(results[:len(images)]):
+            reads[i].append((text, confidence))
+        return reads
+
+    def _record_ocr_variant(self, variant, elapsed, runs, early_exits):
+        with self._ocr_stats_lock:
+            stats = self._ocr_stats[variant]
+            stats["runs"] += runs
+            stats["seconds"] += elapsed
+            stats["early_exits"] += early_exits
+        self.metrics.observe(f"ocr.{variant}", elapsed)
+        self.metrics.incr(f"ocr.{variant}.crops", runs)
+
+    def warm_up(self):
+        """Run one dummy detection and OCR pass so the first real frame doesn't pay for lazy init"""
+        started = time.perf_counter()
+        # self.metrics and the OCR stats may already be shared with live pipeline threads, so the
+        # one-off timings go to a local Metrics and the cascade is run without recording stats
+        metrics = Metrics()
+        self.detect_plates_batch([np.zeros((640, 640, 3), dtype=np.uint8)], metrics=metrics)
+        crop = np.full((48, 160, 3), 255, dtype=np.uint8)
+        self._recognize_batch([self._ocr_preprocessors[variant](crop, metrics=metrics)
+                               for variant in self.ocr_variants])
+        self.logger.info(f"ANPR models warmed up in {time.perf_counter() - started:.2f}s")
+
+    def reset_ocr_stats(self):
+        with self._ocr_stats_lock:
+            self._ocr_stats = {variant: {"runs": 0, "early_exits": 0, "best": 0, "seconds": 0.0}
+                               for variant in self.ocr_variants}
+
+    def get_ocr_stats(self):
+        """Per-variant OCR cascade stats, in cascade order
+
+        ``hit_rate`` is the share of a variant's runs that ended the cascade
+        early; ``best`` counts crops where no variant passed and this one
+        gave the best read anyway; ``avg_ms`` is the mean recognition cost
+        per crop including preprocessing. Use these to tune ``ocr_variants``.
+        """
+        with self._ocr_stats_lock:
+            snapshot = {variant: dict(stats) for variant, stats in self._ocr_stats.items()}
+        for stats in snapshot.values():
+            runs = stats["runs"]
+            stats["hit_rate"] = round(stats["early_exits"] / runs, 3) if runs else 0.0
+            stats["avg_ms"] = round(stats["seconds"] * 1000 / runs, 2) if runs else 0.0
+            del stats["seconds"]
+        return snapshot
+
+    def get_metrics(self):
+        """Snapshot of the stage timers (p50/p95/p99 over the recent window) and counters
+
+        Timers are ``image.load``/``image.decode``, ``frame.total``,
+        ``detect.yolo`` (one per YOLO call, batched or not), ``ocr.total``,
+        ``ocr.<variant>`` for each cascade round and ``ocr.enhance.denoise``.
+        """
+        snapshot = self.metrics.snapshot()
+        snapshot["ocr_cascade"] = self.get_ocr_stats()
+        return snapshot
 
     def process_image(self, image_path):
-        """Process a single image for ANPR"""
-        try:
-            # Load image
+        """Process a single image file for ANPR"""
+        with self.metrics.timer("image.load"):
             image = cv2.imread(image_path)
-            if image is None:
-                self.logger.error(f"Could not load image: {image_path}")
-                return []
+        if image is None:
+            self.logger.error(f"Could not load image: {image_path}")
+            return []
+        return self.process_frame(image)
+
+    def process_image_bytes(self, data):
+        """Process an encoded image (e.g. an upload) without touching disk"""
+        with self.metrics.timer("image.decode"):
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            self.logger.error("Could not decode image data")
+            return []
+        return self.process_frame(image)
+
+    def process_frame(self, image):
+        """Process a BGR frame (numpy array) for ANPR
+
+        Plate crops are views into ``image``, so the frame is never encoded,
+        written or copied on its way to OCR.
+        """
+        try:
+            with self.metrics.timer("frame.total"):
+                return self.read_plates(image, self.detect_plates(image))
+        except Exception as e:
+            self.metrics.incr("frame.errors")
+            self.logger.error(f"Error processing frame: {e}")
+            return []
 
-            # Detect license plates
-            plates = self.detect_plates(image)
-            detections = []
+    def read_plates(self, image, plates):
+        """OCR the ``detect_plates`` boxes of ``image`` into validated detections"""
+        return self.read_plates_batch([image], [plates])[0]
 
+    def read_plates_batch(self, images, plates_per_image):
+        """OCR the plate boxes of several frames together
+
+        All crops from all frames go through one ``extract_text_batch``
+        call; the detections are still reported per box and returned as one
+        list per frame, in order.
+        """
+        crops = []
+        for frame_index, (image, plates) in enumerate(zip(images, plates_per_image)):
             for plate_info in plates:
                 x1, y1, x2, y2 = plate_info['bbox']
-                detection_confidence = plate_info['confidence']
 
                 # Extract plate region
                 plate_img = image[y1:y2, x1:x2]
 
                 if plate_img.size == 0:
                     continue
-
-                # Extract text
-                plate_text, ocr_confidence = self.extract_text(plate_img)
-
-                # Clean and validate
-                cleaned_text = self._clean_plate_text(plate_text)
-
-                if (ocr_confidence >= self.ocr_confidence_threshold and
-                        self._validate_plate(cleaned_text) and
-                        len(cleaned_text) >= 4):
-                    # Calculate combined confidence
-                    combined_confidence = (detection_confidence + ocr_confidence) / 2
-
-                    detection = {
-                        'plate_number': cleaned_text,
-                        'confidence': round(combined_confidence, 3),
-                        'detection_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                        'is_emergency': self._is_emergency_vehicle(cleaned_text),
-                        'bbox': (x1, y1, x2, y2),
-                        'raw_text': plate_text,
-                        'ocr_confidence': round(ocr_confidence, 3),
-                        'detection_confidence': round(detection_confidence, 3)
-                    }
-
-                    detections.append(detection)
-                    self.logger.info(f"Detected plate: {cleaned_text} (confidence: {combined_confidence:.3f})")
-
-            return detections
-
-        except Exception as e:
-            self.logger.error(f"Error processing image {image_path}: {e}")
-            return []
+                crops.append((frame_index, plate_info, plate_img))
+
+        with self.metrics.timer("ocr.total"):
+            reads = self.extract_text_batch([plate_img for _, _, plate_img in crops])
+        detections = [[] for _ in images]
+
+        for (frame_index, plate_info, _), (plate_text, ocr_confidence) in zip(crops, reads):
+            x1, y1, x2, y2 = plate_info['bbox']
+            detection_confidence = plate_info['confidence']
+
+            # Clean and validate
+            cleaned_text = self._clean_plate_text(plate_text)
+
+            if (ocr_confidence >= self.ocr_confidence_threshold and
+                    self._validate_plate(cleaned_text) and
+                    len(cleaned_text) >= 4):
+                # Calculate combined confidence
+                combined_confidence = (detection_confidence + ocr_confidence) / 2
+
+                detection = {
+                    'plate_number': cleaned_text,
+                    'confidence': round(combined_confidence, 3),
+                    'detection_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    'is_emergency': self._is_emergency_vehicle(cleaned_text),
+                    'bbox': (x1, y1, x2, y2),
+                    'raw_text': plate_text,
+                    'ocr_confidence': round(ocr_confidence, 3),
+                    'detection_confidence': round(detection_confidence, 3)
+                }
+                if 'track_id' in plate_info:
+                    detection['track_id'] = plate_info['track_id']
+
+                detections[frame_index].append(detection)
+                self.metrics.incr("ocr.plates")
+                self.logger.info(f"Detected plate: {cleaned_text} (confidence: {combined_confidence:.3f})")
+
+        return detections
 
     def process_camera(self, camera_id=0, display_window=True, save_detections=True, record_video=False,
                        output_video_path=None):
-        """Process live camera feed for real-time ANPR"""
-        cap = cv2.VideoCapture(camera_id)
+        """Process live camera feed for real-time ANPR
+
+        The camera's ROIs and detection sizes come from cameras.json (see
+        camera_config.load_camera_config).
+        """
+        camera = load_camera_config(camera_id)
+        region = DetectionRegion.from_config(camera)
+        cap = cv2.VideoCapture(camera["source"])
 
         # Set camera properties for better quality
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, camera["capture_size"][0])
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, camera["capture_size"][1])
         cap.set(cv2.CAP_PROP_FPS, 30)
 
         if not cap.isOpened():
@@ -281,6 +549,8 @@ class ANPRSystem:
         all_detections = []
         last_detection_time = {}  # Track last detection time for each plate
         detection_cooldown = 5  # Seconds between saving same plate
+        tracker = PlateTracker()  # Only OCR a car until its plate text has settled
+        gate = camera_gate(camera)  # Skip YOLO while the scene is still
 
         self.logger.info(
             "Starting live camera processing. Press 'q' to quit, 's' to save screenshot, 'r' to reset detections")
@@ -295,14 +565,13 @@ class ANPRSystem:
                 frame_count += 1
                 current_time = time.time()
 
-                # Process every 3rd frame for real-time performance
-                if frame_count % 3 == 0:
-                    # Save frame temporarily
-                    temp_frame_path = "temp_camera_frame.jpg"
-                    cv2.imwrite(temp_frame_path, frame)
-
-                    # Process frame
-                    detections = self.process_image(temp_frame_path)
+                # Detect only on moving frames, at the camera's stride while vehicles are around
+                if gate.should_infer(frame):
+                    # Detect on the downscaled ROI; boxes come back in full-resolution pixels
+                    plates = region.detect(frame, self.detect_plates, escalate=gate.moving or bool(tracker.tracks))
+                    gate.report(bool(plates))
+                    to_read, finished = tracker.update(plates, current_time)
+                    detections = tracker.record(self.read_plates(frame, to_read)) + finished
 
                     # Filter detections based on cooldown period
                     valid_detections = []
@@ -323,8 +592,15 @@ class ANPRSystem:
 
                     all_detections.extend(valid_detections)
 
-                    # Draw all current detections on frame
-                    for detection in detections:
+                    # Draw every tracked plate in this frame with its current reading
+                    current = []
+                    for plate_info in plates:
+                        track = tracker.get(plate_info['track_id'])
+                        leading = track.leading_detection() if track else None
+                        if leading is not None:
+                            current.append(dict(leading, bbox=plate_info['bbox']))
+
+                    for detection in current:
                         x1, y1, x2, y2 = detection['bbox']
 
                         # Choose color based on detection type
@@ -352,10 +628,6 @@ class ANPRSystem:
                         cv2.putText(frame, confidence_label, (x1, y1 - 5),
                                     cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1)
 
-                    # Clean up temp file
-                    if os.path.exists(temp_frame_path):
-                        os.remove(temp_frame_path)
-
                 # Add info overlay
                 info_text = f"Detections: {len(all_detections)} | Frame: {frame_count} | Press 'q' to quit"
                 cv2.putText(frame, info_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
@@ -386,6 +658,7 @@ class ANPRSystem:
                 elif key == ord('r'):
                     all_detections.clear()
                     last_detection_time.clear()
+                    tracker.clear()
                     self.logger.info("Detection history reset")
                 elif key == ord('p'):
                     # Pause/unpause
@@ -425,6 +698,7 @@ class ANPRSystem:
 
         frame_count = 0
         all_detections = []
+        gate = MotionGate(min_stride=5, max_stride=15)
 
         while True:
             ret, frame = cap.read()
@@ -433,14 +707,10 @@ class ANPRSystem:
 
             frame_count += 1
 
-            # Process every 5th frame to improve performance
-            if frame_count % 5 == 0:
-                # Save frame temporarily
-                temp_frame_path = "temp_frame.jpg"
-                cv2.imwrite(temp_frame_path, frame)
-
-                # Process frame
-                detections = self.process_image(temp_frame_path)
+            # Detect only when something moves, every 5th frame while plates are in view
+            if gate.should_infer(frame):
+                detections = self.process_frame(frame)
+                gate.report(bool(detections))
 
                 # Add frame info to detections
                 for detection in detections:
@@ -459,10 +729,6 @@ class ANPRSystem:
 
                     cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
 
-                # Clean up
-                if os.path.exists(temp_frame_path):
-                    os.remove(temp_frame_path)
-
             # Write frame to output video
             if output_video_path:
                 out.write(frame)
@@ -485,47 +751,12 @@ class ANPRSystem:
 
     def save_detections(self, detections):
         """Save detections to CSV file"""
-        try:
-            # Load existing data
-            if os.path.exists(self.csv_file):
-                existing_df = pd.read_csv(self.csv_file)
-                next_id = existing_df['id'].max() + 1 if not existing_df.empty else 1
-            else:
-                existing_df = pd.DataFrame()
-                next_id = 1
-
-            # Prepare new data
-            new_data = []
-            for detection in detections:
-                new_data.append({
-                    'id': next_id,
-                    'plate_number': detection['plate_number'],
-                    'confidence': detection['confidence'],
-                    'detection_time': detection['detection_time'],
-                    'is_emergency': detection['is_emergency'],
-                    'processed': False
-                })
-                next_id += 1
-
-            # Create DataFrame and append
-            new_df = pd.DataFrame(new_data)
-            final_df = pd.concat([existing_df, new_df], ignore_index=True)
-
-            # Remove duplicates based on plate number and time (within 5 seconds)
-            final_df['detection_time'] = pd.to_datetime(final_df['detection_time'])
-            final_df = final_df.sort_values('detection_time')
-
-            # Save to CSV
-            final_df.to_csv(self.csv_file, index=False)
-            self.logger.info(f"Saved {len(new_data)} detections to {self.csv_file}")
-
-        except Exception as e:
-            self.logger.error(f"Error saving detections: {e}")
+        self.detection_log.save_detections(detections)
 
     def get_detection_stats(self):
         """Get statistics from detection database"""
         try:
-            df = pd.read_csv(self.csv_file)
+            df = read_table_csv(self.csv_file, "anpr_detections")
             stats = {
                 'total_detections': len(df),
                 'emergency_vehicles': len(df[df['is_emergency'] == True]),
@@ -640,7 +871,7 @@ def main():
 
                 # Show recent detections
                 if os.path.exists(anpr.csv_file):
-                    df = pd.read_csv(anpr.csv_file)
+                    df = read_table_csv(anpr.csv_file, "anpr_detections")
                     if not df.empty:
                         print("\n=== Recent Detections ===")
                         recent = df.tail(10)[['plate_number', 'confidence', 'detection_time', 'is_emergency']]
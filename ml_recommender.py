@@ -1,31 +1,30 @@
 
-import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 import joblib
 import os
+from storage import open_storage
+from archive import HistoryArchive, read_history
 
-def train_spot_recommender(csv_path="parking_data/reservations_history.csv"):
-    if not os.path.exists(csv_path):
-        print("❌ ERROR: File not found:", csv_path)
+def train_spot_recommender(data_dir="parking_data"):
+    storage = open_storage(data_dir)
+    if not storage.exists("reservations"):
+        print("❌ ERROR: No reservation history in", data_dir)
         return
 
-    df = pd.read_csv(csv_path)
+    # Archived + live reservations, only the two columns the model uses
+    df = read_history(storage, HistoryArchive(os.path.join(data_dir, "archive")), "reservations",
+                      columns=["spot_id", "start_time"])
 
     if df.empty:
-        print("⚠️ CSV is empty. Add data to reservations_history.csv first.")
+        print("⚠️ Reservation history is empty. Add reservations first.")
         return
 
-    if "spot_id" not in df.columns or "start_time" not in df.columns:
-        print("❌ CSV missing required columns: 'spot_id' and 'start_time'")
-        return
-
-    # Clean & extract features
+    # Clean & extract features (start_time is already a datetime column)
     df = df.dropna(subset=["spot_id", "start_time"])
+    df["spot_id"] = df["spot_id"].astype(str)
     df["zone"] = df["spot_id"].str[0]
-    df["start_time"] = pd.to_datetime(df["start_time"], errors="coerce")
-    df = df.dropna(subset=["start_time"])
     df["hour"] = df["start_time"].dt.hour
     df["weekday"] = df["start_time"].dt.dayofweek
 
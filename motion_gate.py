@@ -0,0 +1,106 @@
+import threading
+
+import cv2
+import numpy as np
+
+
+# ==== Motion Gate ====
+class MotionGate:
+    """Decides which captured frames are worth running YOLO on
+
+    Each frame is shrunk to ``width`` pixels wide, blurred and compared
+    with a running-average background; if more than ``min_changed`` of the
+    pixels inside the lane polygons changed, something is moving. Inference
+    runs on moving frames every ``stride`` frames, and otherwise only once
+    per ``heartbeat`` frames. ``report(found)`` feeds detection results
+    back: a frame with plates tightens the stride to ``min_stride``, an
+    empty one doubles it up to ``max_stride``.
+
+    ``lanes`` are polygons in full-frame pixel coordinates; without them
+    the whole frame counts. ``moving`` tells whether the last frame passed
+    to ``should_infer`` had motion in them.
+    """
+
+    def __init__(self, lanes=None, width=160, threshold=25, min_changed=0.002, learning_rate=0.05,
+                 min_stride=1, max_stride=10, heartbeat=300):
+        self.lanes = lanes
+        self.width = width
+        self.threshold = threshold
+        self.min_changed = min_changed
+        self.learning_rate = learning_rate
+        self.min_stride = min_stride
+        self.max_stride = max_stride
+        self.heartbeat = heartbeat
+        self.stride = max_stride
+        self.moving = False
+        self.stats = {"frames": 0, "motion_frames": 0, "inferred": 0, "skipped": 0}
+        self._background = None
+        self._mask = None
+        # Due at once: the first frame is always inferred (e.g. a car already waiting at the barrier)
+        self._since_inference = heartbeat
+        self._lock = threading.Lock()
+
+    def should_infer(self, frame):
+        """Whether ``frame`` should go to the detector (call once per captured frame)"""
+        with self._lock:
+            self.stats["frames"] += 1
+            self._since_inference += 1
+            moving = self.moving = self._update(frame)
+            if moving:
+                self.stats["motion_frames"] += 1
+            due = ((moving and self._since_inference >= self.stride) or
+                   self._since_inference >= self.heartbeat)
+            if due:
+                self._since_inference = 0
+                self.stats["inferred"] += 1
+            else:
+                self.stats["skipped"] += 1
+            return due
+
+    def report(self, found):
+        """Adapt the stride to whether the last inferred frame had any plates"""
+        with self._lock:
+            if found:
+                self.stride = self.min_stride
+            else:
+                self.stride = min(self.max_stride, self.stride * 2)
+
+    def reset(self):
+        with self._lock:
+            self._background = None
+            self._mask = None
+            self.stride = self.max_stride
+            self.moving = False
+            self._since_inference = self.heartbeat
+
+    def _update(self, frame):
+        height, width = frame.shape[:2]
+        scale = self.width / float(width)
+        small = cv2.resize(frame, (self.width, max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        small = cv2.GaussianBlur(small, (5, 5), 0)
+
+        if self._background is None or self._background.shape != small.shape:
+            # First frame (or a resolution change): treat as motion so it gets looked at once
+            self._background = small.astype(np.float32)
+            self._mask = self._lane_mask(small.shape, scale)
+            return True
+
+        diff = cv2.absdiff(small, cv2.convertScaleAbs(self._background))
+        cv2.accumulateWeighted(small, self._background, self.learning_rate)
+        changed = diff > self.threshold
+        if self._mask is not None:
+            changed &= self._mask
+            area = int(self._mask.sum())
+        else:
+            area = changed.size
+        return area > 0 and changed.sum() / float(area) >= self.min_changed
+
+    def _lane_mask(self, shape, scale):
+        if not self.lanes:
+            return None
+        mask = np.zeros(shape, dtype=np.uint8)
+        polygons = [np.round(np.asarray(lane, dtype=np.float32) * scale).astype(np.int32) for lane in self.lanes]
+        cv2.fillPoly(mask, polygons, 1)
+        return mask.astype(bool)
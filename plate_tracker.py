@@ -0,0 +1,186 @@
+import itertools
+import threading
+
+
+def iou(a, b):
+    """Intersection over union of two (x1, y1, x2, y2) boxes"""
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / float(area_a + area_b - inter)
+
+
+def _centroid_distance(a, b):
+    """Distance between box centres, relative to the diagonal of ``a``"""
+    dx = (a[0] + a[2] - b[0] - b[2]) / 2
+    dy = (a[1] + a[3] - b[1] - b[3]) / 2
+    diagonal = max(1.0, ((a[2] - a[0]) ** 2 + (a[3] - a[1]) ** 2) ** 0.5)
+    return (dx * dx + dy * dy) ** 0.5 / diagonal
+
+
+class Track:
+    """One plate followed across frames, with its OCR votes"""
+
+    def __init__(self, track_id, bbox, seen_at):
+        self.track_id = track_id
+        self.bbox = bbox
+        self.first_seen = seen_at
+        self.last_seen = seen_at
+        self.updates = 0
+        self.reads = 0
+        self.votes = {}  # plate_number -> summed confidence
+        self.counts = {}  # plate_number -> number of reads
+        self.best = {}  # plate_number -> highest-confidence detection
+        self.settled = None
+        self.reported = False
+
+    @property
+    def leader(self):
+        if not self.votes:
+            return None
+        return max(self.votes, key=self.votes.get)
+
+    @property
+    def plate_number(self):
+        return self.settled or self.leader
+
+    def leading_detection(self):
+        plate = self.plate_number
+        return self.best.get(plate) if plate else None
+
+
+# ==== Plate Tracker ====
+class PlateTracker:
+    """IoU/centroid multi-object tracker that decides which plate boxes still need OCR
+
+    ``update(plates, timestamp)`` matches the detector's boxes to existing
+    tracks (greedy by IoU, then by centre distance for fast movers), tags
+    each box with its ``track_id`` and returns only the boxes whose track
+    is still unsettled. ``record(detections)`` adds the OCR results as
+    confidence-weighted votes; after ``votes_to_settle`` valid reads the
+    leading text is settled and reported once, and the track is not read
+    again. A track that leaves the scene before settling reports its
+    leading text when it is dropped.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_centroid_distance=0.5, max_age=1.5,
+                 votes_to_settle=3, max_reads=8, retry_every=5):
+        self.iou_threshold = iou_threshold
+        self.max_centroid_distance = max_centroid_distance
+        self.max_age = max_age
+        self.votes_to_settle = votes_to_settle
+        self.max_reads = max_reads
+        self.retry_every = retry_every
+        self.tracks = {}
+        self.stats = {"tracks": 0, "ocr_reads": 0, "ocr_skipped": 0}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def get(self, track_id):
+        return self.tracks.get(track_id)
+
+    def update(self, plates, timestamp):
+        """Match ``plates`` to tracks; returns (plates to OCR, detections of finished tracks)"""
+        with self._lock:
+            matched = self._match(plates)
+            to_read = []
+            for plate_info, track in zip(plates, matched):
+                if track is None:
+                    track = Track(next(self._ids), plate_info['bbox'], timestamp)
+                    self.tracks[track.track_id] = track
+                    self.stats["tracks"] += 1
+                track.bbox = plate_info['bbox']
+                track.last_seen = timestamp
+                track.updates += 1
+                plate_info['track_id'] = track.track_id
+                if self._needs_ocr(track):
+                    track.reads += 1
+                    to_read.append(plate_info)
+                    self.stats["ocr_reads"] += 1
+                else:
+                    self.stats["ocr_skipped"] += 1
+
+            finished = []
+            for track_id, track in list(self.tracks.items()):
+                if timestamp - track.last_seen > self.max_age:
+                    del self.tracks[track_id]
+                    detection = self._report(track)
+                    if detection is not None:
+                        finished.append(detection)
+            return to_read, finished
+
+    def record(self, detections):
+        """Vote OCR detections into their tracks; returns the detections of tracks that just settled"""
+        settled = []
+        with self._lock:
+            for detection in detections:
+                track = self.tracks.get(detection.get('track_id'))
+                if track is None or track.settled:
+                    continue
+                plate = detection['plate_number']
+                track.votes[plate] = track.votes.get(plate, 0) + detection['confidence']
+                track.counts[plate] = track.counts.get(plate, 0) + 1
+                if detection['confidence'] >= track.best.get(plate, {}).get('confidence', -1):
+                    track.best[plate] = detection
+                if sum(track.counts.values()) >= self.votes_to_settle:
+                    track.settled = track.leader
+                    report = self._report(track)
+                    if report is not None:
+                        settled.append(report)
+        return settled
+
+    def clear(self):
+        with self._lock:
+            self.tracks.clear()
+
+    def _needs_ocr(self, track):
+        if track.settled:
+            return False
+        if track.reads < self.max_reads:
+            return True
+        # Nothing readable after max_reads: keep trying, but only occasionally
+        return track.updates % self.retry_every == 0
+
+    def _report(self, track):
+        if track.reported:
+            return None
+        detection = track.leading_detection()
+        if detection is None:
+            return None
+        track.reported = True
+        plate = track.plate_number
+        return dict(detection, track_id=track.track_id, votes=track.counts[plate],
+                    vote_share=round(track.votes[plate] / sum(track.votes.values()), 3))
+
+    def _match(self, plates):
+        """Greedy assignment of boxes to tracks: best IoU first, then nearest centre"""
+        matched = [None] * len(plates)
+        free = dict(self.tracks)
+
+        pairs = []
+        for i, plate_info in enumerate(plates):
+            for track in free.values():
+                overlap = iou(track.bbox, plate_info['bbox'])
+                if overlap >= self.iou_threshold:
+                    pairs.append((overlap, i, track.track_id))
+        for _, i, track_id in sorted(pairs, reverse=True):
+            if matched[i] is None and track_id in free:
+                matched[i] = free.pop(track_id)
+
+        pairs = []
+        for i, plate_info in enumerate(plates):
+            if matched[i] is not None:
+                continue
+            for track in free.values():
+                distance = _centroid_distance(track.bbox, plate_info['bbox'])
+                if distance <= self.max_centroid_distance:
+                    pairs.append((distance, i, track.track_id))
+        for _, i, track_id in sorted(pairs):
+            if matched[i] is None and track_id in free:
+                matched[i] = free.pop(track_id)
+
+        return matched
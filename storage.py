@@ -0,0 +1,976 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+# ==== Table Definitions ====
+# Every ParkingDatabase table, its CSV file name, lookup key and columns.
+# SQL types are only used by the SQLite backend. Keys are indexed rather than
+# declared unique because older CSVs contain duplicate ids (len(df) + 1).
+TABLES = {
+    "parking_spots": {
+        "file": "parking_spots.csv",
+        "key": "spot_id",
+        "columns": [
+            ("spot_id", "TEXT PRIMARY KEY"), ("zone", "TEXT"), ("status", "TEXT"),
+            ("plate_number", "TEXT COLLATE NOCASE"), ("reserved_by", "TEXT"),
+            ("reserved_until", "TEXT"), ("last_updated", "TEXT"), ("version", "INTEGER DEFAULT 0"),
+        ],
+        "indexes": [("status",), ("zone", "status")],
+        # Bumped on every change; claims compare-and-set against it
+        "defaults": {"version": 0},
+    },
+    "reservations": {
+        "file": "reservations_history.csv",
+        "key": "id",
+        "columns": [
+            ("id", "INTEGER"), ("spot_id", "TEXT"), ("plate_number", "TEXT COLLATE NOCASE"),
+            ("customer_name", "TEXT"), ("start_time", "TEXT"), ("end_time", "TEXT"),
+            ("duration_minutes", "NUMERIC"), ("detection_time", "TEXT"), ("status", "TEXT"),
+            ("created_at", "TEXT"),
+        ],
+        "indexes": [("id",), ("spot_id",), ("plate_number",), ("status",), ("end_time",)],
+        "journal": True,
+        # Finished reservations move to archive.py's month partitions
+        "archive": {"date": "created_at", "statuses": ["expired", "cancelled"]},
+    },
+    "emergency_vehicles": {
+        "file": "emergency_vehicles.csv",
+        "key": "plate_number",
+        "columns": [
+            ("plate_number", "TEXT COLLATE NOCASE"), ("vehicle_type", "TEXT"),
+            ("description", "TEXT"), ("is_active", "INTEGER"), ("added_date", "TEXT"),
+        ],
+        "indexes": [("plate_number",)],
+    },
+    "admin_users": {
+        "file": "admin_users.csv",
+        "key": "username",
+        "columns": [
+            ("username", "TEXT"), ("password_hash", "TEXT"), ("email", "TEXT"),
+            ("role", "TEXT"), ("created_at", "TEXT"), ("last_login", "TEXT"),
+        ],
+        "indexes": [("username",)],
+    },
+    "anpr_detections": {
+        "file": "anpr_detections.csv",
+        "key": "id",
+        "columns": [
+            ("id", "INTEGER"), ("plate_number", "TEXT COLLATE NOCASE"), ("confidence", "REAL"),
+            ("detection_time", "TEXT"), ("camera_location", "TEXT"), ("is_emergency", "INTEGER"),
+            ("processed", "INTEGER"),
+        ],
+        "indexes": [("id",), ("plate_number",), ("detection_time",)],
+        "archive": {"date": "detection_time"},
+    },
+    "priority_queue": {
+        "file": "priority_queue.csv",
+        "key": "id",
+        "columns": [
+            ("id", "INTEGER"), ("plate_number", "TEXT COLLATE NOCASE"), ("name", "TEXT"),
+            ("contact", "TEXT"), ("timestamp", "TEXT"), ("notified", "INTEGER"),
+        ],
+        "indexes": [("id",), ("notified",)],
+    },
+}
+
+
+# ==== Column Types ====
+# In-memory dtype of every column that isn't free text, applied on every read
+# and write. Timestamps are datetime64 (int64 epoch-ns), labels categoricals,
+# ids and counters nullable Int64 and flags plain bools. Files keep their
+# readable format: ISO timestamps, "Unlimited" durations, True/False flags.
+UNLIMITED_DURATION = -1
+
+SCHEMAS = {
+    "parking_spots": {
+        "zone": "category", "status": "category", "reserved_until": "datetime",
+        "last_updated": "datetime", "version": "int",
+    },
+    "reservations": {
+        "id": "int", "spot_id": "category", "start_time": "datetime", "end_time": "datetime",
+        "duration_minutes": "duration", "detection_time": "datetime", "status": "category",
+        "created_at": "datetime",
+    },
+    "emergency_vehicles": {"vehicle_type": "category", "is_active": "bool", "added_date": "datetime"},
+    "admin_users": {"role": "category", "created_at": "datetime", "last_login": "datetime"},
+    "anpr_detections": {
+        "id": "int", "confidence": "float", "detection_time": "datetime", "camera_location": "category",
+        "is_emergency": "bool", "processed": "bool",
+    },
+    "priority_queue": {"id": "int", "timestamp": "datetime", "notified": "bool"},
+    # users.csv belongs to UserDatabase, not to a storage backend
+    "users": {"points": "int", "created_at": "datetime", "last_login": "datetime"},
+}
+
+_BOOL_VALUES = {"true": True, "false": False, "1": True, "0": False, "1.0": True, "0.0": False}
+
+
+def _to_bool(value):
+    return _BOOL_VALUES.get(str(value).strip().lower(), False)
+
+
+def _coerce(kind, series):
+    """Convert a column to the in-memory dtype for ``kind`` (no-op if it already is)"""
+    if kind == "category":
+        return series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype("category")
+    if kind == "datetime":
+        if pd.api.types.is_datetime64_dtype(series):
+            return series
+        return pd.to_datetime(series, errors="coerce", format="ISO8601")
+    if kind in ("int", "duration"):
+        if series.dtype == "Int64":
+            return series
+        if kind == "duration":
+            series = series.replace("Unlimited", UNLIMITED_DURATION)
+        return pd.to_numeric(series, errors="coerce").astype("Int64")
+    if kind == "float":
+        return pd.to_numeric(series, errors="coerce")
+    if kind == "bool":
+        if series.dtype == bool:
+            return series
+        return series.map(_to_bool, na_action="ignore").fillna(False).astype(bool)
+    return series
+
+
+def apply_schema(table, df):
+    """Give ``df`` the declared in-memory dtypes of ``table`` (in place, also returned)"""
+    for column, kind in SCHEMAS.get(table, {}).items():
+        if column in df.columns:
+            df[column] = _coerce(kind, df[column])
+    return df
+
+
+def coerce_value(table, column, value):
+    """In-memory form of a single value, e.g. an ISO string becomes a Timestamp"""
+    kind = SCHEMAS.get(table, {}).get(column)
+    if kind is None or kind == "category":
+        return value
+    return _coerce(kind, pd.Series([value], dtype=object)).iloc[0]
+
+
+def typed_record(table, row):
+    return {column: coerce_value(table, column, value) for column, value in row.items()}
+
+
+def _iso(series):
+    # Same text as datetime.isoformat(): microseconds only when non-zero
+    return series.dt.strftime("%Y-%m-%dT%H:%M:%S.%f").str.replace(r"\.000000$", "", regex=True)
+
+
+def to_disk(table, df):
+    """Copy of ``df`` in the on-disk representation"""
+    df = apply_schema(table, df.copy())
+    for column, kind in SCHEMAS.get(table, {}).items():
+        if column not in df.columns:
+            continue
+        if kind == "datetime":
+            df[column] = _iso(df[column])
+        elif kind == "duration":
+            df[column] = df[column].astype(object).mask(df[column].eq(UNLIMITED_DURATION).fillna(False), "Unlimited")
+    return df
+
+
+def disk_value(table, column, value):
+    """On-disk form of a single value (journal records, SQL parameters)"""
+    kind = SCHEMAS.get(table, {}).get(column)
+    if kind is None or kind == "category":
+        return value
+    value = coerce_value(table, column, value)
+    if pd.isna(value):
+        return None
+    if kind == "datetime":
+        return value.isoformat()
+    if kind == "duration" and value == UNLIMITED_DURATION:
+        return "Unlimited"
+    return value.item() if hasattr(value, "item") else value
+
+
+def disk_record(table, row):
+    return {column: disk_value(table, column, value) for column, value in row.items()}
+
+
+def is_unlimited(duration):
+    return not pd.isna(duration) and (duration == UNLIMITED_DURATION or duration == "Unlimited")
+
+
+def format_timestamp(value):
+    """ISO text for a timestamp column value, "" when missing"""
+    if value is None or pd.isna(value):
+        return ""
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def _csv_dtypes(table):
+    kinds = SCHEMAS.get(table, {})
+    dtypes = {column: "category" for column, kind in kinds.items() if kind == "category"}
+    if table in TABLES:
+        # Free text stays text - no per-load inference (plates like "1234" stay strings)
+        dtypes.update({column: str for column in table_columns(table) if column not in kinds})
+    return dtypes
+
+
+def read_table_csv(path, table):
+    """Load a CSV straight into the typed in-memory form of ``table``"""
+    return apply_schema(table, pd.read_csv(path, dtype=_csv_dtypes(table)))
+
+
+def write_table_csv(df, path, table):
+    to_disk(table, df).to_csv(path, index=False)
+
+
+def _set_cells(table, df, rows, column, value):
+    """Assign ``value`` to the given row positions of ``column``, keeping its dtype"""
+    value = coerce_value(table, column, value)
+    if column not in df.columns:
+        df[column] = None
+    series = df[column]
+    if isinstance(series.dtype, pd.CategoricalDtype) and not pd.isna(value) \
+            and value not in series.cat.categories:
+        df[column] = series.cat.add_categories([value])
+    df.iloc[rows, df.columns.get_loc(column)] = value
+
+
+def _apply_updates(table, df, updates):
+    """Apply ``(key_value, changes)`` pairs to ``df`` in place; returns the number of rows matched"""
+    # One vectorized isin() over the key column, then a position map of only the matching
+    # rows: grouping the whole table on every write costs seconds on large frames
+    keys = df[TABLES[table]["key"]]
+    hits = keys.isin([key_value for key_value, _ in updates]).fillna(False).to_numpy(dtype=bool).nonzero()[0]
+    positions = {}
+    for position, key_value in zip(hits, keys.iloc[hits].tolist()):
+        positions.setdefault(key_value, []).append(position)
+    matched = 0
+    for key_value, changes in updates:
+        rows = positions.get(key_value)
+        if rows is None:
+            continue
+        matched += len(rows)
+        for column, value in changes.items():
+            _set_cells(table, df, rows, column, value)
+    return matched
+
+
+def _filter_frame(table, df, where=None, order_by=None, descending=False, limit=None):
+    nocase = _nocase_columns(table)
+    for column, value in (where or {}).items():
+        if column in nocase:
+            df = df[df[column].astype(str).str.upper() == str(value).upper()]
+        else:
+            df = df[(df[column] == coerce_value(table, column, value)).fillna(False)]
+    if order_by:
+        df = df.sort_values(order_by, ascending=not descending)
+    if limit is not None:
+        df = df.head(limit)
+    return df
+
+
+def table_columns(table):
+    return [name for name, _ in TABLES[table]["columns"]]
+
+
+def with_defaults(table, df):
+    """Add or fill columns that older files don't have yet"""
+    for column, value in TABLES[table].get("defaults", {}).items():
+        if column not in df.columns:
+            df[column] = value
+        else:
+            df[column] = df[column].fillna(value)
+    return df
+
+
+def _nocase_columns(table):
+    return {name for name, sql_type in TABLES[table]["columns"] if "NOCASE" in sql_type}
+
+
+def _json_default(value):
+    if value is pd.NA or value is pd.NaT:
+        return None
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def _to_sql_value(value):
+    """Convert pandas/numpy scalars into something sqlite3 can bind"""
+    if value is None:
+        return None
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+# ==== CSV Backend ====
+class CSVStorage:
+    """One CSV file per table - the original parking_data layout
+
+    Tables marked ``"journal": True`` (reservations) are stored as a CSV
+    snapshot plus an append-only JSON-lines journal of inserts and status
+    transitions. Writes only append a line; the journal is folded back into
+    the snapshot every ``compact_every`` records.
+
+    Inside ``transaction()`` writes are held in memory and flushed once at
+    the end: one rewrite per touched table and one journal append. A
+    ``savepoint()`` inside it remembers the held writes (copying a table
+    only when it is first modified) and puts them back if its block raises,
+    so a failed command leaves nothing behind in the flush. ``create()``
+    writes straight to disk and cannot be rolled back.
+    """
+
+    name = "csv"
+
+    def __init__(self, data_dir, compact_every=1000):
+        self.data_dir = data_dir
+        self.compact_every = compact_every
+        self._lock = threading.RLock()
+        self._journal_counts = {}
+        self._next_ids = {}
+        self._batch_depth = 0
+        self._dirty = {}
+        self._pending = {}
+        self._savepoints = []
+        os.makedirs(data_dir, exist_ok=True)
+
+    def path(self, table):
+        return os.path.join(self.data_dir, TABLES[table]["file"])
+
+    def journal_path(self, table):
+        return os.path.splitext(self.path(table))[0] + "_journal.jsonl"
+
+    def _journaled(self, table):
+        return TABLES[table].get("journal", False)
+
+    def exists(self, table):
+        return os.path.exists(self.path(table))
+
+    def data_version(self, table):
+        """(mtime, inode, size) of the table's files - changes whenever anyone rewrites them"""
+        paths = [self.path(table)]
+        if self._journaled(table):
+            paths.append(self.journal_path(table))
+        version = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+                version.append((st.st_mtime_ns, st.st_ino, st.st_size))
+            except FileNotFoundError:
+                version.append(None)
+        return tuple(version)
+
+    @contextmanager
+    def transaction(self):
+        """Group several writes into one flush per table"""
+        with self._lock:
+            self._batch_depth += 1
+            try:
+                yield
+            finally:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self._flush()
+
+    @contextmanager
+    def savepoint(self):
+        """Undo the writes held by the enclosing transaction if the block raises"""
+        with self._lock:
+            savepoint = {
+                "frames": {},
+                "pending": {table: len(records) for table, records in self._pending.items()},
+                "next_ids": dict(self._next_ids),
+            }
+            self._savepoints.append(savepoint)
+            try:
+                yield
+            except BaseException:
+                self._rollback(savepoint)
+                raise
+            finally:
+                self._savepoints.pop()
+
+    def _rollback(self, savepoint):
+        for table, df in savepoint["frames"].items():
+            if df is None:
+                self._dirty.pop(table, None)
+            else:
+                # A copy, so an outer savepoint holding the same frame still has it untouched
+                self._dirty[table] = df.copy()
+        for table in list(self._pending):
+            if table in savepoint["pending"]:
+                del self._pending[table][savepoint["pending"][table]:]
+            else:
+                del self._pending[table]
+        self._next_ids = savepoint["next_ids"]
+
+    def _remember(self, table):
+        """Record ``table``'s held frame in every open savepoint before it is first modified"""
+        for savepoint in self._savepoints:
+            if table not in savepoint["frames"]:
+                dirty = self._dirty.get(table)
+                savepoint["frames"][table] = dirty.copy() if dirty is not None else None
+
+    def _flush(self):
+        dirty, self._dirty = self._dirty, {}
+        pending, self._pending = self._pending, {}
+        for table, df in dirty.items():
+            write_table_csv(df, self.path(table), table)
+        for table, records in pending.items():
+            self._append_journal(table, *records)
+
+    def create(self, table, df=None):
+        """Write a whole table, replacing whatever was there"""
+        if df is None:
+            df = pd.DataFrame(columns=table_columns(table))
+        df = with_defaults(table, df.copy())
+        with self._lock:
+            self._dirty.pop(table, None)
+            self._pending.pop(table, None)
+            write_table_csv(df, self.path(table), table)
+            if os.path.exists(self.journal_path(table)):
+                os.remove(self.journal_path(table))
+            self._journal_counts.pop(table, None)
+            self._next_ids.pop(table, None)
+
+    def read(self, table):
+        with self._lock:
+            if table in self._dirty:
+                return self._dirty[table].copy()
+            return self._load(table)
+
+    def _load(self, table):
+        df = read_table_csv(self.path(table), table)
+        if self._journaled(table):
+            df = self._replay(table, df)
+        return apply_schema(table, with_defaults(table, df))
+
+    def _frame(self, table):
+        """Table to modify in place: the batch's dirty copy, or a fresh read"""
+        self._remember(table)
+        if table in self._dirty:
+            return self._dirty[table]
+        return self._load(table)
+
+    def _write(self, table, df):
+        if self._batch_depth:
+            self._dirty[table] = df
+        else:
+            write_table_csv(df, self.path(table), table)
+
+    def insert(self, table, row):
+        with self._lock:
+            if self._journaled(table):
+                self._append_journal(table, {"op": "insert", "row": disk_record(table, row)})
+                if "id" in row:
+                    self._next_ids[table] = max(self._next_ids.get(table, 1), int(row["id"]) + 1)
+                return
+            new_row = apply_schema(table, pd.DataFrame([row]))
+            df = apply_schema(table, pd.concat([self._frame(table), new_row], ignore_index=True))
+            self._write(table, df)
+
+    def update(self, table, key_value, changes):
+        """Apply column changes to the row(s) with the given key"""
+        return self.update_many(table, [(key_value, changes)])
+
+    def update_many(self, table, updates):
+        """Apply many ``(key_value, changes)`` updates with a single read-modify-write"""
+        updates = list(updates)
+        if not updates:
+            return 0
+        with self._lock:
+            if self._journaled(table):
+                self._append_journal(table, *[
+                    {"op": "update", "key": disk_value(table, TABLES[table]["key"], key_value),
+                     "changes": disk_record(table, changes)}
+                    for key_value, changes in updates
+                ])
+                return None
+            df = self._frame(table)
+            matched = _apply_updates(table, df, updates)
+            self._write(table, df)
+            return matched
+
+    def compare_and_set(self, table, key_value, expected, changes):
+        """Apply ``changes`` only if the row still has the ``expected`` values"""
+        with self._lock:
+            key = TABLES[table]["key"]
+            df = self._frame(table)
+            mask = df[key] == key_value
+            for column, value in expected.items():
+                mask &= df[column] == coerce_value(table, column, value)
+            rows = mask.fillna(False).to_numpy(dtype=bool).nonzero()[0]
+            if not len(rows):
+                return False
+            for column, value in changes.items():
+                _set_cells(table, df, rows, column, value)
+            self._write(table, df)
+            return True
+
+    def select(self, table, where=None, order_by=None, descending=False, limit=None):
+        """Rows matching all ``where`` equalities (plates compare case-insensitively)"""
+        return _filter_frame(table, self.read(table), where, order_by, descending, limit)
+
+    def next_id(self, table):
+        with self._lock:
+            if self._journaled(table) and table in self._next_ids:
+                return self._next_ids[table]
+            df = self._dirty[table] if table in self._dirty else self._load(table)
+            next_id = int(df["id"].max()) + 1 if not df.empty else 1
+            if self._journaled(table):
+                self._next_ids[table] = next_id
+            return next_id
+
+    # ---- Journal ----
+    def _append_journal(self, table, *records):
+        if self._batch_depth:
+            self._pending.setdefault(table, []).extend(records)
+            return
+        with open(self.journal_path(table), "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record, default=_json_default) + "\n" for record in records))
+        self._journal_counts[table] = self._journal_length(table) + len(records)
+        if self._journal_counts[table] >= self.compact_every:
+            self.compact(table)
+
+    def _journal_length(self, table):
+        if table not in self._journal_counts:
+            self._journal_counts[table] = len(self._read_journal(table))
+        return self._journal_counts[table]
+
+    def _read_journal(self, table):
+        path = self.journal_path(table)
+        if not os.path.exists(path):
+            return []
+        records = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn last line from a crash mid-append; everything before it is valid
+                    break
+        return records
+
+    def _replay(self, table, df):
+        """Apply journaled inserts and transitions on top of the snapshot"""
+        records = self._read_journal(table) + self._pending.get(table, [])
+        if not records:
+            return df
+        key = TABLES[table]["key"]
+        inserted = []
+        inserted_by_key = {}
+        snapshot_updates = []
+        for record in records:
+            if record["op"] == "insert":
+                row = dict(record["row"])
+                inserted.append(row)
+                inserted_by_key.setdefault(row.get(key), []).append(row)
+            elif record["op"] == "update":
+                if record["key"] in inserted_by_key:
+                    for row in inserted_by_key[record["key"]]:
+                        row.update(record["changes"])
+                else:
+                    snapshot_updates.append(record)
+        for record in snapshot_updates:
+            rows = (df[key] == coerce_value(table, key, record["key"])).fillna(False).to_numpy(dtype=bool).nonzero()[0]
+            for column, value in record["changes"].items():
+                _set_cells(table, df, rows, column, value)
+        if inserted:
+            df = pd.concat([df, apply_schema(table, pd.DataFrame(inserted))], ignore_index=True)
+        return apply_schema(table, df)
+
+    def compact(self, table):
+        """Fold the journal into a fresh snapshot and start a new journal"""
+        with self._lock:
+            df = self._load(table)
+            tmp_path = self.path(table) + ".tmp"
+            write_table_csv(df, tmp_path, table)
+            os.replace(tmp_path, self.path(table))
+            if os.path.exists(self.journal_path(table)):
+                os.remove(self.journal_path(table))
+            self._journal_counts[table] = 0
+
+
+# ==== SQLite Backend ====
+class SQLiteStorage:
+    """Single SQLite database in WAL mode with indexed, row-level updates"""
+
+    name = "sqlite"
+    # data_version() covers the whole database, not a single table
+    shared_version = True
+
+    def __init__(self, data_dir, db_file="smartpark.db"):
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+        self.db_path = os.path.join(data_dir, db_file)
+        self._local = threading.local()
+        self._watch = None
+        self._watch_lock = threading.Lock()
+        self._create_schema()
+
+    def _conn(self):
+        # sqlite3 connections are not shareable across threads; WAL lets
+        # each thread read while another one writes.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        for table, spec in TABLES.items():
+            columns = ", ".join(f"{name} {sql_type}" for name, sql_type in spec["columns"])
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for name, sql_type in spec["columns"]:
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}")
+            for index_columns in spec["indexes"]:
+                index_name = f"idx_{table}_{'_'.join(index_columns)}"
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({', '.join(index_columns)})")
+
+    def path(self, table):
+        return self.db_path
+
+    def data_version(self, table):
+        """PRAGMA data_version of one dedicated connection: it moves on every commit by any other connection"""
+        with self._watch_lock:
+            if self._watch is None:
+                self._watch = sqlite3.connect(self.db_path, timeout=30, isolation_level=None,
+                                              check_same_thread=False)
+            return self._watch.execute("PRAGMA data_version").fetchone()[0]
+
+    @contextmanager
+    def transaction(self):
+        """BEGIN IMMEDIATE ... COMMIT, or a savepoint when already inside one"""
+        conn = self._conn()
+        if conn.in_transaction:
+            with self.savepoint():
+                yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @contextmanager
+    def savepoint(self):
+        """Nested unit of work that can be rolled back on its own"""
+        conn = self._conn()
+        depth = getattr(self._local, "depth", 0)
+        name = f"sp{depth}"
+        self._local.depth = depth + 1
+        conn.execute(f"SAVEPOINT {name}")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute(f"ROLLBACK TO {name}")
+            conn.execute(f"RELEASE {name}")
+            raise
+        else:
+            conn.execute(f"RELEASE {name}")
+        finally:
+            self._local.depth = depth
+
+    def exists(self, table):
+        row = self._conn().execute("SELECT 1 FROM meta WHERE key = ?", (f"init:{table}",)).fetchone()
+        return row is not None
+
+    def create(self, table, df=None):
+        columns = table_columns(table)
+        rows = [] if df is None else to_disk(table, with_defaults(table, df.reindex(columns=columns))).itertuples(
+            index=False, name=None)
+        with self.transaction() as conn:
+            conn.execute(f"DELETE FROM {table}")
+            conn.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                ([_to_sql_value(v) for v in row] for row in rows)
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, '1')", (f"init:{table}",))
+
+    def read(self, table):
+        columns = ", ".join(table_columns(table))
+        return apply_schema(table, pd.read_sql_query(f"SELECT {columns} FROM {table}", self._conn()))
+
+    def _params(self, table, values):
+        return [_to_sql_value(disk_value(table, column, value)) for column, value in values]
+
+    def insert(self, table, row):
+        columns = [c for c in table_columns(table) if c in row]
+        self._conn().execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+            self._params(table, [(c, row[c]) for c in columns])
+        )
+
+    def update(self, table, key_value, changes):
+        key = TABLES[table]["key"]
+        assignments = ", ".join(f"{column} = ?" for column in changes)
+        cursor = self._conn().execute(
+            f"UPDATE {table} SET {assignments} WHERE {key} = ?",
+            self._params(table, list(changes.items()) + [(key, key_value)])
+        )
+        return cursor.rowcount
+
+    def update_many(self, table, updates):
+        """Apply many ``(key_value, changes)`` updates in one transaction"""
+        key = TABLES[table]["key"]
+        matched = 0
+        with self.transaction() as conn:
+            for key_value, changes in updates:
+                assignments = ", ".join(f"{column} = ?" for column in changes)
+                cursor = conn.execute(
+                    f"UPDATE {table} SET {assignments} WHERE {key} = ?",
+                    self._params(table, list(changes.items()) + [(key, key_value)])
+                )
+                matched += cursor.rowcount
+        return matched
+
+    def compare_and_set(self, table, key_value, expected, changes):
+        """Apply ``changes`` only if the row still has the ``expected`` values"""
+        key = TABLES[table]["key"]
+        assignments = ", ".join(f"{column} = ?" for column in changes)
+        conditions = " AND ".join([f"{key} = ?"] + [f"{column} = ?" for column in expected])
+        cursor = self._conn().execute(
+            f"UPDATE {table} SET {assignments} WHERE {conditions}",
+            self._params(table, list(changes.items()) + [(key, key_value)] + list(expected.items()))
+        )
+        return cursor.rowcount > 0
+
+    def select(self, table, where=None, order_by=None, descending=False, limit=None):
+        sql = f"SELECT {', '.join(table_columns(table))} FROM {table}"
+        params = []
+        if where:
+            sql += " WHERE " + " AND ".join(f"{column} = ?" for column in where)
+            params = self._params(table, where.items())
+        if order_by:
+            sql += f" ORDER BY {order_by} {'DESC' if descending else 'ASC'}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return apply_schema(table, pd.read_sql_query(sql, self._conn(), params=params))
+
+    def next_id(self, table):
+        row = self._conn().execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}").fetchone()
+        return int(row[0])
+
+
+# ==== Table Cache ====
+class CachedStorage:
+    """Write-through, process-wide cache of whole tables in front of a backend
+
+    Reads are served from memory (a copy, so callers can't corrupt it) after
+    a cheap ``data_version`` check: a stat() for CSV, ``PRAGMA data_version``
+    for SQLite. Our own writes are applied to the cached frames as they
+    happen, and the version they leave behind is adopted when the write (or
+    the outermost transaction) finishes, so they never cause a reload. Only
+    another process writing the files invalidates a table. A rolled back
+    savepoint drops the cache, since the frames may hold undone changes.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.name = storage.name
+        self.data_dir = storage.data_dir
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+        self._lock = threading.RLock()
+        self._tables = {}
+        self._versions = {}
+        self._inserted = {}
+        self._depth = 0
+        self._before = {}
+        self._touched = set()
+
+    def __getattr__(self, name):
+        # path, exists, journal_path, compact, ... go straight to the backend
+        return getattr(self.storage, name)
+
+    def invalidate(self, table=None):
+        with self._lock:
+            tables = [table] if table is not None else list(self._tables)
+            for name in tables:
+                if self._tables.pop(name, None) is not None:
+                    self.stats["invalidations"] += 1
+                self._versions.pop(name, None)
+                self._inserted.pop(name, None)
+
+    def _frame(self, table):
+        """Cached frame with any queued inserts folded in, None if not cached"""
+        df = self._tables.get(table)
+        if df is not None and self._inserted.get(table):
+            rows = apply_schema(table, pd.DataFrame(self._inserted.pop(table)))
+            df = apply_schema(table, pd.concat([df, rows], ignore_index=True))
+            self._tables[table] = df
+        return df
+
+    def read(self, table):
+        with self._lock:
+            if table in self._tables and (self._depth or self.storage.data_version(table) == self._versions[table]):
+                self.stats["hits"] += 1
+                return self._frame(table).copy()
+            self.stats["misses"] += 1
+            self.invalidate(table)
+        # The backend read happens outside our lock: the writer thread holds the backend's lock
+        # for a whole transaction and takes ours inside it, so the reverse order would deadlock
+        version = self.storage.data_version(table)
+        df = self.storage.read(table)
+        with self._lock:
+            # Mid-write we could be caching rows that are about to change, and a write that
+            # finished since the read leaves a newer version behind, so cache neither
+            if not self._depth and self.storage.data_version(table) == version:
+                self._tables[table] = df
+                self._versions[table] = version
+                self._inserted.pop(table, None)
+        return df.copy()
+
+    def select(self, table, where=None, order_by=None, descending=False, limit=None):
+        return _filter_frame(table, self.read(table), where, order_by, descending, limit)
+
+    def next_id(self, table):
+        with self._lock:
+            df = self._frame(table)
+            if df is not None:
+                return int(df["id"].max()) + 1 if df["id"].notna().any() else 1
+        return self.storage.next_id(table)
+
+    # ---- Writes ----
+    @contextmanager
+    def _writing(self, table=None):
+        with self._lock:
+            self._depth += 1
+            if self._depth == 1:
+                self._before = {name: self.storage.data_version(name) for name in self._tables}
+                for name, version in self._before.items():
+                    if version != self._versions[name]:
+                        self.invalidate(name)  # someone else wrote since we cached it
+                self._touched = set()
+            if table is not None:
+                self._touched.add(table)
+        try:
+            yield
+        except BaseException:
+            self.invalidate()
+            raise
+        finally:
+            with self._lock:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._adopt_versions()
+
+    def _adopt_versions(self):
+        for name in list(self._tables):
+            version = self.storage.data_version(name)
+            ours = name in self._touched or getattr(self.storage, "shared_version", False)
+            if version == self._before.get(name) or ours:
+                self._versions[name] = version
+            else:
+                self.invalidate(name)
+
+    @contextmanager
+    def transaction(self):
+        with self._writing():
+            with self.storage.transaction() as conn:
+                yield conn
+
+    @contextmanager
+    def savepoint(self):
+        try:
+            with self.storage.savepoint() as sp:
+                yield sp
+        except BaseException:
+            self.invalidate()
+            raise
+
+    def create(self, table, df=None):
+        with self._writing(table):
+            self.storage.create(table, df)
+            self.invalidate(table)
+
+    def insert(self, table, row):
+        with self._writing(table):
+            self.storage.insert(table, row)
+            if table in self._tables:
+                # Appended lazily: one concat per read instead of one per insert
+                self._inserted.setdefault(table, []).append(dict(row))
+
+    def update(self, table, key_value, changes):
+        return self.update_many(table, [(key_value, changes)])
+
+    def update_many(self, table, updates):
+        updates = list(updates)
+        with self._writing(table):
+            matched = self.storage.update_many(table, updates)
+            df = self._frame(table)
+            if df is not None:
+                _apply_updates(table, df, updates)
+            return matched
+
+    def compare_and_set(self, table, key_value, expected, changes):
+        with self._writing(table):
+            applied = self.storage.compare_and_set(table, key_value, expected, changes)
+            df = self._frame(table)
+            if applied and df is not None:
+                _apply_updates(table, df, [(key_value, changes)])
+            return applied
+
+
+# ==== Migration ====
+def migrate_csv_to_sqlite(storage, data_dir=None):
+    """One-shot import of parking_data/*.csv into an empty SQLite store
+
+    Tables that were already initialized in the database are left alone,
+    so calling this on every startup is cheap and never overwrites data.
+    """
+    csv_storage = CSVStorage(data_dir or storage.data_dir)
+    migrated = []
+    for table in TABLES:
+        if storage.exists(table) or not csv_storage.exists(table):
+            continue
+        try:
+            df = csv_storage.read(table)
+        except pd.errors.EmptyDataError:
+            df = None
+        storage.create(table, df)
+        migrated.append(table)
+    return migrated
+
+
+def open_storage(data_dir, backend=None):
+    """Open the configured storage backend ("csv" or "sqlite")"""
+    backend = (backend or os.getenv("SMARTPARK_STORAGE", "csv")).lower()
+    if backend == "csv":
+        return CSVStorage(data_dir)
+    if backend == "sqlite":
+        storage = SQLiteStorage(data_dir)
+        migrate_csv_to_sqlite(storage)
+        return storage
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+if __name__ == "__main__":
+    sqlite_storage = SQLiteStorage("parking_data")
+    tables = migrate_csv_to_sqlite(sqlite_storage)
+    if tables:
+        print("✅ Migrated to", sqlite_storage.db_path + ":")
+        for name in tables:
+            print("•", name)
+    else:
+        print("Nothing to migrate - SQLite store already initialized.")
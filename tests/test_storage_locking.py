@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import CachedStorage, CSVStorage  # noqa: E402
+from write_actor import WriteActor  # noqa: E402
+
+
+class CachedStorageLockOrderTest(unittest.TestCase):
+    """A reader missing the cache must not deadlock with a WriteActor batch
+
+    The batch holds the backend's lock for its whole transaction and takes
+    the cache's lock inside it (create -> invalidate), so a cache miss must
+    not hold the cache's lock while it waits on the backend.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = CachedStorage(CSVStorage(self.tmp.name))
+        self.storage.create("reservations")
+        self.writer = WriteActor(self.storage)
+
+    def tearDown(self):
+        self.writer.stop()
+        self.tmp.cleanup()
+
+    def test_reads_during_table_resets_do_not_deadlock(self):
+        stop = threading.Event()
+        errors = []
+
+        def read_loop():
+            while not stop.is_set():
+                try:
+                    self.storage.read("reservations")
+                except Exception as e:
+                    errors.append(e)
+                    return
+
+        reader = threading.Thread(target=read_loop, daemon=True)
+        reader.start()
+        try:
+            for _ in range(200):
+                # Like full_factory_reset: recreate the table on the writer thread, which invalidates the cache
+                self.writer.submit(self.storage.create, "reservations").result(timeout=10)
+        finally:
+            stop.set()
+            reader.join(timeout=10)
+
+        self.assertFalse(reader.is_alive(), "reader is stuck on the storage locks")
+        self.assertEqual(errors, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
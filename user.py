@@ -3,6 +3,7 @@ import pandas as pd
 from datetime import datetime
 import os
 from passlib.context import CryptContext
+from storage import read_table_csv, write_table_csv
 
 # Password hashing configuration
 pwd_context = CryptContext(
@@ -34,10 +35,10 @@ class UserDatabase:
         return pwd_context.verify(password, hashed)
 
     def load_users(self):
-        return pd.read_csv(self.users_file)
+        return read_table_csv(self.users_file, "users")
 
     def save_users(self, df):
-        df.to_csv(self.users_file, index=False)
+        write_table_csv(df, self.users_file, "users")
 
     def signup(self, username, password):
         df = self.load_users()
@@ -47,8 +48,8 @@ class UserDatabase:
             "username": username,
             "password_hash": self.hash_password(password),
             "points": 10,  # First login reward
-            "created_at": datetime.now().isoformat(),
-            "last_login": datetime.now().isoformat()
+            "created_at": datetime.now(),
+            "last_login": datetime.now()
         }])
         df = pd.concat([df, new_user], ignore_index=True)
         self.save_users(df)
@@ -61,7 +62,7 @@ class UserDatabase:
             hashed = user_row.iloc[0]['password_hash']
             if self.verify_password(password, hashed):
                 index = user_row.index[0]
-                df.at[index, 'last_login'] = datetime.now().isoformat()
+                df.at[index, 'last_login'] = datetime.now()
                 df.at[index, 'points'] += 10  # Login reward
                 self.save_users(df)
                 return True, df.loc[index].to_dict()
@@ -0,0 +1,111 @@
+import functools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class WriteActor:
+    """Single writer thread that owns all mutations of a storage backend
+
+    Callers submit commands and get a Future back. The thread takes a batch
+    of commands (up to ``max_batch``, or whatever arrives within ``max_delay``
+    seconds of the first one), runs each in its own savepoint inside one
+    storage transaction and commits once - a group commit. Futures are
+    resolved only after the commit, so a result is never reported for a
+    write that didn't reach disk.
+    """
+
+    def __init__(self, storage, max_batch=64, max_delay=0.002, on_failure=None):
+        self.storage = storage
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.on_failure = on_failure
+        self.stats = {"commands": 0, "batches": 0, "failures": 0}
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def in_writer_thread(self):
+        return threading.get_ident() == self._thread.ident
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            command = self._queue.get()
+            if command is None:
+                return
+            batch = [command]
+            stopping = False
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    command = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if command is None:
+                    stopping = True
+                    break
+                batch.append(command)
+            self._commit(batch)
+            if stopping:
+                return
+
+    def _commit(self, batch):
+        outcomes = []
+        failed = False
+        try:
+            with self.storage.transaction():
+                for fn, args, kwargs, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with self.storage.savepoint():
+                            outcomes.append((future, fn(*args, **kwargs), None))
+                    except Exception as e:
+                        failed = True
+                        outcomes.append((future, None, e))
+        except Exception as e:
+            # The commit itself failed: nothing in this batch was persisted
+            failed = True
+            outcomes = [(future, None, e) for _, _, _, future in batch if future.running()]
+
+        self.stats["commands"] += len(batch)
+        self.stats["batches"] += 1
+        if failed:
+            self.stats["failures"] += 1
+            if self.on_failure:
+                try:
+                    self.on_failure()
+                except Exception as e:
+                    print(f"Error recovering from failed write: {e}")
+
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+def serialized(method):
+    """Run a ParkingDatabase method on its writer thread and wait for the result
+
+    Calls made from the writer thread itself (a command calling another
+    mutating method) run inline, so commands can be composed freely.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        writer = getattr(self, "writer", None)
+        if writer is None or writer.in_writer_thread():
+            return method(self, *args, **kwargs)
+        return writer.submit(method, self, *args, **kwargs).result()
+    return wrapper